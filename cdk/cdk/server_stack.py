@@ -5,6 +5,7 @@ from aws_cdk import (
     aws_apigateway as apigw,
     aws_applicationautoscaling as appscaling,
     aws_backup as backup,
+    aws_dynamodb as dynamodb,
     aws_ec2 as ec2,
     aws_ecs as ecs,
     aws_efs as efs,
@@ -14,6 +15,7 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_logs as logs,
     aws_logs_destinations as logs_destinations,
+    aws_s3_assets as s3_assets,
     aws_sqs as sqs,
     Tags,
 )
@@ -27,6 +29,23 @@ PROJECT_TAG_KEY = "project"
 
 LAMBDA_DISCORD_BASE_NAME = "servers"
 
+# On-instance scripts are unpacked here by the instance user data
+SERVER_SCRIPTS_DIR = "/opt/servers"
+# systemd units started on every boot: name -> (description, script, oneshot)
+SERVER_UNITS = {
+    "boot-agent": ("Game server boot agent", "boot_agent.py", True),
+    "log-shaper": ("Game server log shaper", "log_shaper.py", False),
+    "watchdog": ("Game server memory watchdog", "watchdog.py", False),
+}
+# Discord channel webhook the watchdog announces restarts to, created by hand
+DISCORD_WEBHOOK_PARAMETER = "/servers/discord-webhook-url"
+
+# Fixed name so the instance user data can name the table without a reference
+SESSION_TABLE_NAME = f"{LAMBDA_DISCORD_BASE_NAME}-sessions"
+
+# Fixed name so the backup lambda can toggle the rule that invokes it
+BACKUP_SCHEDULE_RULE_NAME = f"{LAMBDA_DISCORD_BASE_NAME}-backup-schedule"
+
 TAG_MORIA = "moria"
 TAG_SERVERS = "servers"
 TAG_VALHEIM = "valheim"
@@ -39,6 +58,9 @@ class GameServersStack(cdk.Stack):
 
         route53_domain_base = os.environ.get("ROUTE53_DOMAIN_BASE")
         route53_zone_id = os.environ.get("ROUTE53_HOSTED_ZONE_ID")
+        # "elastic" scales EFS throughput with each request instead of spending
+        # burst credits; anything else keeps the default bursting mode.
+        efs_throughput_mode = os.environ.get("EFS_THROUGHPUT_MODE", "bursting")
 
         # VPC
         self.vpc = ec2.Vpc(
@@ -78,6 +100,11 @@ class GameServersStack(cdk.Stack):
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
             encrypted=False,
             lifecycle_policy=efs.LifecyclePolicy.AFTER_14_DAYS,
+            throughput_mode=(
+                efs.ThroughputMode.ELASTIC
+                if efs_throughput_mode.lower() == "elastic"
+                else efs.ThroughputMode.BURSTING
+            ),
         )
         Tags.of(self.efs).add(PROJECT_TAG_KEY, TAG_VALHEIM)  # Old tag name
 
@@ -90,7 +117,8 @@ class GameServersStack(cdk.Stack):
         )
 
         # Backups
-        # Back up the EFS volume every hour, retain for 3 days
+        # Day-to-day backups are started by the backup lambda when servers save or
+        # stop. The plan keeps a weekly safety net backup, retained for 2 weeks.
         self.backup = backup.BackupPlan(self, f"{BASENAME}BackupPlan")
         Tags.of(self.backup).add(PROJECT_TAG_KEY, TAG_VALHEIM)
         self.backup.add_selection(
@@ -99,11 +127,36 @@ class GameServersStack(cdk.Stack):
         )
         self.backup.add_rule(
             backup.BackupPlanRule(
-                schedule_expression=events.Schedule.cron(minute="0"),
-                delete_after=cdk.Duration.days(3),
+                schedule_expression=events.Schedule.cron(
+                    minute="0", hour="12", week_day="MON"
+                ),
+                delete_after=cdk.Duration.days(14),
             )
         )
 
+        # Role assumed by AWS Backup for on-demand backup jobs
+        self.backup_role = iam.Role(
+            self,
+            f"{BASENAME}BackupRole",
+            assumed_by=iam.ServicePrincipal("backup.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSBackupServiceRolePolicyForBackup"
+                )
+            ],
+        )
+
+        # On-instance scripts and config (boot agent, log shaper, memory watchdog,
+        # Moria launcher, sysctl-network.conf and the logrotate rule), downloaded
+        # by the instance user data
+        self.server_scripts = s3_assets.Asset(
+            self, "ServerScriptsAsset", path="../server"
+        )
+        # Modules shared with the lambdas (sessions), installed next to the scripts
+        self.server_shared_modules = s3_assets.Asset(
+            self, "ServerSharedModulesAsset", path="../lambda/shared"
+        )
+
         ##################################################
         # Valheim server
         ##################################################
@@ -122,6 +175,7 @@ class GameServersStack(cdk.Stack):
             key_pair=self.keypair,
             allow_all_outbound=True,
             associate_public_ip_address=True,
+            user_data=self.create_server_user_data(game=TAG_VALHEIM),
             vpc=self.vpc,
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
         )
@@ -129,6 +183,10 @@ class GameServersStack(cdk.Stack):
         Tags.of(self.ec2_valheim).add("ROUTE53_HOSTED_ZONE_ID", route53_zone_id)
         Tags.of(self.ec2_valheim).add("ROUTE53_DOMAIN", f"valheim{route53_domain_base}")
 
+        self.server_scripts.grant_read(self.ec2_valheim.role)
+        self.server_shared_modules.grant_read(self.ec2_valheim.role)
+        self.add_iam_server_parameters(self.ec2_valheim.role)
+
         # Add Cloudwatch logging roles
         self.ec2_valheim.role.add_managed_policy(
             iam.ManagedPolicy.from_aws_managed_policy_name(
@@ -185,7 +243,10 @@ class GameServersStack(cdk.Stack):
         # Moria server
         ##################################################
 
-        # Requires a larger root volume for Docker, cannot use EFS for device mounts
+        # Requires a larger root volume for Docker, cannot use EFS for device mounts.
+        # Also holds the server install, see server/moria_launcher.py. Changing
+        # the size here replaces the instance, grow the volume in place instead
+        # (see MAINTENANCE.md)
         self.root_volume_moria = ec2.BlockDevice(
             device_name="/dev/sda1", volume=ec2.BlockDeviceVolume.ebs(12)
         )
@@ -205,6 +266,7 @@ class GameServersStack(cdk.Stack):
             allow_all_outbound=True,
             associate_public_ip_address=True,
             block_devices=[self.root_volume_moria],
+            user_data=self.create_server_user_data(game=TAG_MORIA),
             vpc=self.vpc,
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
         )
@@ -212,6 +274,10 @@ class GameServersStack(cdk.Stack):
         Tags.of(self.ec2_moria).add("ROUTE53_HOSTED_ZONE_ID", route53_zone_id)
         Tags.of(self.ec2_moria).add("ROUTE53_DOMAIN", f"moria{route53_domain_base}")
 
+        self.server_scripts.grant_read(self.ec2_moria.role)
+        self.server_shared_modules.grant_read(self.ec2_moria.role)
+        self.add_iam_server_parameters(self.ec2_moria.role)
+
         # Add Cloudwatch logging roles
         self.ec2_moria.role.add_managed_policy(
             iam.ManagedPolicy.from_aws_managed_policy_name(
@@ -279,6 +345,7 @@ class GameServersStack(cdk.Stack):
             "SQS_SERVER_START_URL": self.server_start_queue.queue_url,
             "ROUTE53_DOMAIN_BASE": route53_domain_base,
             "ROUTE53_HOSTED_ZONE_ID": route53_zone_id,
+            "SESSION_TABLE_NAME": SESSION_TABLE_NAME,
         }
 
         lambda_layer = _lambda.LayerVersion(
@@ -350,21 +417,8 @@ class GameServersStack(cdk.Stack):
         self.add_iam_ec2(target_lambda=self.lambda_stop, instance_arn=ec2_moria_arn)
         self.add_iam_ec2_describe(target_lambda=self.lambda_stop)
 
-        # https://slmkitani.medium.com/passing-custom-headers-through-amazon-api-gateway-to-an-aws-lambda-function-f3a1cfdc0e29
-        request_templates = {
-            "application/json": """{
-                "method": "$context.httpMethod",
-                "body" : $input.json("$"),
-                "headers": {
-                    #foreach($param in $input.params().header.keySet())
-                    "$param": "$util.escapeJavaScript($input.params().header.get($param))"
-                    #if($foreach.hasNext),#end
-                    #end
-                }
-            }
-            """
-        }
-
+        # Lambda proxy integrations pass the raw body and headers through, which the
+        # interaction handler needs to verify Discord's request signature.
         self.apigateway = apigw.RestApi(self, "FlaskAppEndpoint")
         Tags.of(self.apigateway).add(PROJECT_TAG_KEY, TAG_SERVERS)
         self.apigateway.root.add_method("ANY")
@@ -373,7 +427,7 @@ class GameServersStack(cdk.Stack):
             "valheim"
         )
         self.discord_interaction_webhook_integration_valheim = apigw.LambdaIntegration(
-            self.lambda_discord, request_templates=request_templates
+            self.lambda_discord
         )
         self.discord_interaction_webhook_valheim.add_method(
             "POST", self.discord_interaction_webhook_integration_valheim
@@ -383,15 +437,23 @@ class GameServersStack(cdk.Stack):
             "moria"
         )
         self.discord_interaction_webhook_integration_moria = apigw.LambdaIntegration(
-            self.lambda_discord, request_templates=request_templates
+            self.lambda_discord
         )
         self.discord_interaction_webhook_moria.add_method(
             "POST", self.discord_interaction_webhook_integration_moria
         )
 
+        # Lower latency front door: a function URL invokes the interaction lambda
+        # directly with payload format 2.0, skipping API Gateway. Point a Discord
+        # application's interactions endpoint at {url}valheim or {url}moria.
+        self.discord_function_url = self.lambda_discord.add_function_url(
+            auth_type=_lambda.FunctionUrlAuthType.NONE
+        )
+        cdk.CfnOutput(self, "DiscordFunctionUrl", value=self.discord_function_url.url)
+
         # Lambda to update Route 53 DNS
         self.lambda_updatedns = self.create_lambda(
-            name="updatedns", environment=self.env_vars, layers=[]
+            name="updatedns", environment=self.env_vars, layers=[lambda_layer]
         )
         self.add_iam_ec2_describe(target_lambda=self.lambda_updatedns)
         self.add_iam_route53_update(
@@ -412,6 +474,127 @@ class GameServersStack(cdk.Stack):
             state="running",
         )
 
+        ##################################################
+        # Backups
+        ##################################################
+
+        backup_env_vars = {
+            "BACKUP_MIN_INTERVAL_MINUTES": "60",
+            "BACKUP_RESOURCE_ARN": self.efs.file_system_arn,
+            "BACKUP_RETENTION_DAYS": "3",
+            "BACKUP_ROLE_ARN": self.backup_role.role_arn,
+            "BACKUP_SCHEDULE_RULE_NAME": BACKUP_SCHEDULE_RULE_NAME,
+            "BACKUP_VAULT_NAME": self.backup.backup_vault.backup_vault_name,
+            "SESSION_TABLE_NAME": SESSION_TABLE_NAME,
+        }
+        self.lambda_backup = self.create_lambda(
+            name="backup", environment=backup_env_vars, layers=[lambda_layer]
+        )
+        Tags.of(self.lambda_backup).add(PROJECT_TAG_KEY, TAG_SERVERS)
+        self.add_iam_ec2_describe(target_lambda=self.lambda_backup)
+        self.add_iam_backup(target_lambda=self.lambda_backup)
+
+        # Periodic backups while any server is running. The backup lambda enables
+        # this rule when a server starts and disables it when all have stopped.
+        self.backup_schedule_rule = events.Rule(
+            self,
+            f"{BASENAME}BackupScheduleRule",
+            rule_name=BACKUP_SCHEDULE_RULE_NAME,
+            schedule=events.Schedule.rate(cdk.Duration.hours(1)),
+        )
+        self.backup_schedule_rule.add_target(
+            aws_events_targets.LambdaFunction(self.lambda_backup, retry_attempts=0)
+        )
+
+        # Enable the schedule on start, back up on stop
+        for name, instance_arn in (
+            ("Valheim", ec2_valheim_arn),
+            ("Moria", ec2_moria_arn),
+        ):
+            for state in ("running", "stopped"):
+                self.subscribe_event_bridge_ec2_state_change(
+                    name=f"{name}{state.capitalize()}",
+                    target_lambda=self.lambda_backup,
+                    instance_arn=instance_arn,
+                    state=state,
+                )
+
+        # Back up after Valheim world saves. Return to Moria does not log saves and
+        # relies on the periodic schedule.
+        self.backup_subscription_filter_valheim = logs.SubscriptionFilter(
+            self,
+            f"ValheimSaveLogSubscriptionFilter",
+            log_group=self.log_group_valheim,
+            destination=logs_destinations.LambdaDestination(self.lambda_backup),
+            filter_pattern=logs.FilterPattern.literal(r"%World saved%"),
+        )
+
+        ##################################################
+        # Sessions
+        ##################################################
+
+        # Append-only request, start, stop, ready and player count events, see
+        # lambda/shared/sessions.py
+        self.sessions_table = dynamodb.Table(
+            self,
+            "ServersSessionsTable",
+            table_name=SESSION_TABLE_NAME,
+            partition_key=dynamodb.Attribute(
+                name="server", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(name="at", type=dynamodb.AttributeType.NUMBER),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=cdk.RemovalPolicy.RETAIN,
+        )
+        for grantee in (
+            self.server_start,
+            self.lambda_stop,
+            self.lambda_startmsg,
+            self.lambda_backup,
+            self.ec2_valheim.role,
+            self.ec2_moria.role,
+        ):
+            self.add_iam_sessions(grantee)
+
+    def add_iam_backup(self, target_lambda: _lambda.Function):
+        """Permission to start on-demand backups of world storage and to pause or
+        resume the periodic backup rule."""
+        target_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["backup:StartBackupJob"],
+                resources=[self.backup.backup_vault.backup_vault_arn],
+            )
+        )
+        target_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["backup:ListBackupJobs"],
+                resources=["*"],
+            )
+        )
+        target_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["iam:PassRole"],
+                resources=[self.backup_role.role_arn],
+            )
+        )
+        target_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["events:EnableRule", "events:DisableRule"],
+                resources=[
+                    cdk.Stack.format_arn(
+                        self,
+                        service="events",
+                        resource="rule",
+                        resource_name=BACKUP_SCHEDULE_RULE_NAME,
+                    )
+                ],
+            )
+        )
+
     def add_iam_ec2(self, target_lambda: _lambda.Function, instance_arn: str):
         """Permission to start/stop an ec2 instance."""
         target_lambda.add_to_role_policy(
@@ -479,8 +662,29 @@ class GameServersStack(cdk.Stack):
             )
         )
 
+    def add_iam_server_parameters(self, role: iam.IRole):
+        """Permission for on-instance scripts to read their SSM parameters."""
+        role.add_to_principal_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["ssm:GetParameter"],
+                resources=[
+                    cdk.Stack.format_arn(
+                        self,
+                        service="ssm",
+                        resource="parameter",
+                        resource_name=DISCORD_WEBHOOK_PARAMETER.lstrip("/"),
+                    )
+                ],
+            )
+        )
+
+    def add_iam_sessions(self, grantee: iam.IGrantable):
+        """Permission to append session events."""
+        self.sessions_table.grant(grantee, "dynamodb:PutItem")
+
     def add_iam_sqs(self, target_lambda: _lambda.Function, target_queue: sqs.Queue):
-        """Permission to enqueue and read SQS messages."""
+        """Permission to enqueue, read and consume SQS messages."""
 
         target_lambda.add_to_role_policy(
             iam.PolicyStatement(
@@ -488,6 +692,8 @@ class GameServersStack(cdk.Stack):
                 actions=[
                     "sqs:SendMessage",
                     "sqs:ReceiveMessage",
+                    "sqs:DeleteMessage",
+                    "sqs:ChangeMessageVisibility",
                 ],
                 resources=[target_queue.queue_arn],
             )
@@ -516,6 +722,67 @@ class GameServersStack(cdk.Stack):
             environment=environment,
         )
 
+    def create_server_user_data(self, game: str) -> ec2.UserData:
+        """User data that installs the on-instance scripts and starts their units.
+
+        Runs on every boot, not just the first, so instances pick up new scripts
+        after a deploy and a restart.
+        """
+        commands = ec2.UserData.for_linux()
+        commands.add_commands(
+            "command -v aws || snap install aws-cli --classic",
+            "python3 -c 'import boto3' || apt-get install -y python3-boto3",
+        )
+        scripts_zip = commands.add_s3_download_command(
+            bucket=self.server_scripts.bucket,
+            bucket_key=self.server_scripts.s3_object_key,
+        )
+        shared_zip = commands.add_s3_download_command(
+            bucket=self.server_shared_modules.bucket,
+            bucket_key=self.server_shared_modules.s3_object_key,
+        )
+        commands.add_commands(
+            f"rm -rf {SERVER_SCRIPTS_DIR}",
+            f"python3 -m zipfile -e {scripts_zip} {SERVER_SCRIPTS_DIR}",
+            f"python3 -m zipfile -e {shared_zip} {SERVER_SCRIPTS_DIR}",
+            f"install -m 644 {SERVER_SCRIPTS_DIR}/sysctl-network.conf "
+            "/etc/sysctl.d/90-servers-network.conf",
+            "sysctl --system",
+            f"install -m 644 {SERVER_SCRIPTS_DIR}/logrotate-servers.conf "
+            "/etc/logrotate.d/servers",
+        )
+        for unit, (description, script, oneshot) in SERVER_UNITS.items():
+            service_type = "Type=oneshot" if oneshot else "Type=simple\nRestart=always"
+            commands.add_commands(
+                f"""cat > /etc/systemd/system/{LAMBDA_DISCORD_BASE_NAME}-{unit}.service <<EOF
+[Unit]
+Description={description}
+After=network-online.target docker.service
+Wants=network-online.target
+
+[Service]
+{service_type}
+Environment=AWS_DEFAULT_REGION={self.region}
+Environment=SESSION_TABLE_NAME={SESSION_TABLE_NAME}
+ExecStart=/usr/bin/python3 {SERVER_SCRIPTS_DIR}/{script} --game {game}
+EOF"""
+            )
+        commands.add_commands("systemctl daemon-reload")
+        for unit in SERVER_UNITS:
+            commands.add_commands(
+                f"systemctl restart --no-block {LAMBDA_DISCORD_BASE_NAME}-{unit}.service"
+            )
+
+        user_data = ec2.MultipartUserData()
+        user_data.add_part(
+            ec2.MultipartBody.from_raw_body(
+                content_type='text/cloud-config; charset="utf-8"',
+                body="cloud_final_modules:\n- [scripts-user, always]\n",
+            )
+        )
+        user_data.add_user_data_part(commands, ec2.MultipartBody.SHELL_SCRIPT, True)
+        return user_data
+
     def subscribe_event_bridge_ec2_state_change(
         self, name: str, target_lambda: _lambda.Function, instance_arn: str, state: str
     ):
@@ -0,0 +1,146 @@
+import datetime
+import os
+
+import boto3
+
+import serverlog
+import sessions
+
+
+logger = serverlog.get_logger()
+
+aws_backup = boto3.client("backup")
+ec2 = boto3.client("ec2")
+events = boto3.client("events")
+
+PROJECT_TAG_KEY = "project"
+SERVER_PROJECTS = ["moria", "valheim"]
+ACTIVE_JOB_STATES = {"CREATED", "PENDING", "RUNNING"}
+CAPPED_JOB_STATES = ACTIVE_JOB_STATES | {"COMPLETED"}
+
+
+def servers_running() -> bool:
+    """True if any game server instance is pending or running."""
+    response = ec2.describe_instances(
+        Filters=[
+            {"Name": f"tag:{PROJECT_TAG_KEY}", "Values": SERVER_PROJECTS},
+            {"Name": "instance-state-name", "Values": ["pending", "running"]},
+        ]
+    )
+    return any(reservation["Instances"] for reservation in response["Reservations"])
+
+
+def instance_server(instance_id: str) -> str | None:
+    """Game server name of an instance, from its project tag."""
+    response = ec2.describe_instances(InstanceIds=[instance_id])
+    for reservation in response["Reservations"]:
+        for instance in reservation["Instances"]:
+            for tag in instance.get("Tags", []):
+                if tag["Key"] == PROJECT_TAG_KEY and tag["Value"] in SERVER_PROJECTS:
+                    return tag["Value"]
+    return None
+
+
+def record_session(event: dict):
+    """Record a server start or stop at the time of the state change, whether it
+    was started from Discord, the console or a schedule."""
+    instance_id = event["detail"]["instance-id"]
+    try:
+        server = instance_server(instance_id)
+    except Exception as ex:
+        logger.error("Could not look up instance %s: %s", instance_id, ex)
+        return
+    if server is None:
+        return
+    at = datetime.datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
+    sessions.record(
+        server,
+        "start" if event["detail"]["state"] == "running" else "stop",
+        at=int(at.timestamp() * 1000),
+        instance_id=instance_id,
+    )
+
+
+def recent_backup_jobs(since: datetime.datetime) -> list[dict]:
+    response = aws_backup.list_backup_jobs(
+        ByResourceArn=os.environ["BACKUP_RESOURCE_ARN"],
+        ByCreatedAfter=since,
+    )
+    return response["BackupJobs"]
+
+
+def start_backup(reason: str, capped: bool) -> bool:
+    """Start an on-demand backup of the world filesystem.
+
+    Capped backups are skipped if another backup was started within the minimum
+    interval.  Uncapped backups (at server stop) only skip when a backup job is
+    still in progress, since that job will already capture the final save.
+    """
+    interval = int(os.environ.get("BACKUP_MIN_INTERVAL_MINUTES", "60"))
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        minutes=interval
+    )
+    skip_states = CAPPED_JOB_STATES if capped else ACTIVE_JOB_STATES
+    for job in recent_backup_jobs(since):
+        if job["State"] in skip_states:
+            logger.info(
+                "Skipping %s backup, job %s is %s",
+                reason,
+                job["BackupJobId"],
+                job["State"],
+            )
+            return False
+
+    response = aws_backup.start_backup_job(
+        BackupVaultName=os.environ["BACKUP_VAULT_NAME"],
+        ResourceArn=os.environ["BACKUP_RESOURCE_ARN"],
+        IamRoleArn=os.environ["BACKUP_ROLE_ARN"],
+        StartWindowMinutes=60,
+        Lifecycle={
+            "DeleteAfterDays": int(os.environ.get("BACKUP_RETENTION_DAYS", "3"))
+        },
+    )
+    logger.info("Started %s backup job %s", reason, response["BackupJobId"])
+    return True
+
+
+def set_schedule(enabled: bool):
+    """Pause or resume the periodic backup rule."""
+    rule_name = os.environ["BACKUP_SCHEDULE_RULE_NAME"]
+    if enabled:
+        events.enable_rule(Name=rule_name)
+    else:
+        events.disable_rule(Name=rule_name)
+    logger.info("Backup schedule %s", "enabled" if enabled else "disabled")
+
+
+@serverlog.invocation
+def handler(event, context):
+    """Back up world storage when it changes rather than on a fixed clock.
+
+    * World save log lines back up while a server is running, capped in frequency.
+    * A periodic rule backs up servers that do not log saves, capped likewise.
+      It is enabled when a server starts and disabled once all servers stop.
+    * A server stopping always triggers a final backup.
+
+    Server starts and stops are also recorded as session events.
+    """
+    logger.info("Received event", event="event_received", payload=event)
+
+    if "awslogs" in event:
+        start_backup(reason="world save", capped=True)
+    elif event.get("source") == "aws.ec2":
+        record_session(event)
+        state = event["detail"]["state"]
+        if state == "running":
+            set_schedule(enabled=True)
+        elif state == "stopped":
+            start_backup(reason="server stop", capped=False)
+            if not servers_running():
+                set_schedule(enabled=False)
+    elif servers_running():
+        start_backup(reason="scheduled", capped=True)
+    else:
+        set_schedule(enabled=False)
+
+    return {"statusCode": 200}
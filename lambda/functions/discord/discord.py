@@ -1,11 +1,11 @@
+import base64
 import json
-import logging
 import os
 
-import awsgi
 import boto3
-from discord_interactions import verify_key_decorator
-from flask import Flask, jsonify, request
+from discord_interactions import verify_key
+
+import serverlog
 
 
 INTERACTIONS = {"start", "stop", "status"}
@@ -18,64 +18,118 @@ SERVER_NAMES = {
     "1442796677156175966": "Moria",  # Moria
     "1370896965881299065": "Valheim",  # Valheim
 }
+INSTANCE_NAMES = {
+    SERVER_INSTANCES[app_id]: name for app_id, name in SERVER_NAMES.items()
+}
+# Named groups of ec2 instance ids that a command can target instead of the
+# application's own server. Keep in sync with GROUPS in register_bot.py
+SERVER_GROUPS = {
+    "all": sorted(SERVER_INSTANCES.values()),
+}
+# Map of interaction endpoint paths to Discord application public keys
+PUBLIC_KEYS = {
+    # https://discord.com/developers/applications/1442796677156175966/information
+    "/moria": "4763ec4eebb1d89859f3a41ec601ff238f8b5a6047d9961b9590c1d533410658",
+    # https://discord.com/developers/applications/1370896965881299065/information
+    "/valheim": "e9f996f69a848f285e4444a41f50f3b485321e7906744e6a97ef4bde0a20ddf3",
+}
 
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = serverlog.get_logger()
 
-app = Flask(__name__)
 aws_lambda = boto3.client("lambda")
 
 
-@app.route("/moria", methods=["POST"])
-@verify_key_decorator(
-    "4763ec4eebb1d89859f3a41ec601ff238f8b5a6047d9961b9590c1d533410658"
-)
-def moria():
-    """https://discord.com/developers/applications/1442796677156175966/information"""
-    return discord()
+def parse_request(event: dict) -> tuple[str, str, dict, str]:
+    """Read method, path, headers and raw body from either an API Gateway REST
+    proxy event (payload format 1.0) or an HTTP API / function URL event
+    (payload format 2.0).  Header names are lowercased."""
+    if event.get("version") == "2.0":
+        method = event["requestContext"]["http"]["method"]
+        path = event["rawPath"]
+    else:
+        method = event["httpMethod"]
+        path = event["path"]
+
+    headers = {
+        name.lower(): value for name, value in (event.get("headers") or {}).items()
+    }
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode("utf-8")
+    return method, path, headers, body
+
 
+def response(status_code: int, body) -> dict:
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(body),
+    }
 
-@app.route("/valheim", methods=["POST"])
-@verify_key_decorator(
-    "e9f996f69a848f285e4444a41f50f3b485321e7906744e6a97ef4bde0a20ddf3"
-)
-def valheim():
-    """https://discord.com/developers/applications/1370896965881299065/information"""
-    return discord()
 
+def requester(request_json: dict) -> str | None:
+    """Username of whoever sent the interaction.  Guild interactions carry a
+    member, direct messages only a user."""
+    user = (request_json.get("member") or request_json).get("user") or {}
+    return user.get("username")
 
-def discord():
+
+def discord(request_json: dict) -> dict:
     """Discord interaction Lambda must return within three seconds or else Discord marks
     the interaction as a failure.  Perform significant work in secondary lambdas.
     """
-    request_json = request.json
-
     # Respond to ping
     if request_json["type"] == 1:
-        return jsonify({"type": 1})
+        return {"type": 1}
     # Process command
     else:
-        logger.info(f"Request: {request_json}")
+        logger.info(
+            "Interaction request", event="interaction_request", request=request_json
+        )
         try:
-            interaction_option = request_json["data"]["options"][0]["value"]
+            options = {
+                option["name"]: option["value"]
+                for option in request_json["data"]["options"]
+            }
         except KeyError:
-            interaction_option = None
+            options = {}
             logger.error("Unparseable interaction option")
+        group = options.pop("group", None)
+        interaction_option = next(iter(options.values()), None)
 
         if interaction_option not in INTERACTIONS:
             logger.error("Invalid interaction option: %s", interaction_option)
             raise ValueError
 
-        logger.info(f"Interaction: {interaction_option}")
+        if group is not None and group not in SERVER_GROUPS:
+            logger.error("Invalid server group: %s", group)
+            raise ValueError
+
+        logger.info(
+            "Interaction",
+            event="interaction",
+            option=interaction_option,
+            group=group,
+            application_id=request_json["application_id"],
+        )
 
         app_id = request_json["application_id"]
+        if group:
+            instance_ids = SERVER_GROUPS[group]
+        else:
+            instance_ids = [SERVER_INSTANCES.get(app_id)]
         payload = {
             # Pass Discord application_id and token to edit the response from other lambdas
             "application_id": app_id,
             "application_name": SERVER_NAMES.get(app_id),
-            "instance_id": SERVER_INSTANCES.get(app_id),
+            "instance_ids": instance_ids,
+            "instance_names": {
+                instance_id: INSTANCE_NAMES.get(instance_id)
+                for instance_id in instance_ids
+            },
             "token": request_json["token"],
+            "requester": requester(request_json),
         }
 
         aws_lambda.invoke(
@@ -96,8 +150,26 @@ def discord():
         #         "allowed_mentions": {"parse": []},
         #     },
         # }
-        return jsonify({"type": 5})
+        return {"type": 5}
 
 
+@serverlog.invocation
 def handler(event, context):
-    return awsgi.response(app, event, context, base64_content_types={"image/png"})
+    """Serves both the REST API and the function URL front doors.  The raw body is
+    verified against the Discord application's public key before it is parsed."""
+    method, path, headers, body = parse_request(event)
+
+    public_key = PUBLIC_KEYS.get(path.rstrip("/"))
+    if method != "POST" or public_key is None:
+        return response(404, {"error": "Not found"})
+
+    signature = headers.get("x-signature-ed25519")
+    timestamp = headers.get("x-signature-timestamp")
+    if (
+        signature is None
+        or timestamp is None
+        or not verify_key(body.encode("utf-8"), signature, timestamp, public_key)
+    ):
+        return response(401, {"error": "Bad request signature"})
+
+    return response(200, discord(json.loads(body)))
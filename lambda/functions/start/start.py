@@ -1,31 +1,98 @@
 import json
-import logging
 import os
 
 import boto3
+import requests
+from botocore.exceptions import ClientError
 
+import serverlog
+import sessions
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+
+logger = serverlog.get_logger()
 
 ec2 = boto3.client("ec2")
 ecs = boto3.client("ecs")
 sqs = boto3.client("sqs")
 
 
+def start_instances(instance_ids: list[str]) -> dict[str, dict]:
+    """Start all instances with one StartInstances call.  EC2 rejects the whole
+    call if any instance cannot be started, so fall back to one call per
+    instance to find out which ones failed."""
+    try:
+        response = ec2.start_instances(InstanceIds=instance_ids)
+    except ClientError as ex:
+        if len(instance_ids) == 1:
+            return {instance_ids[0]: {"error": ex.response["Error"]["Code"]}}
+        logger.warning("Batched start failed, starting one at a time: %s", ex)
+        results = {}
+        for instance_id in instance_ids:
+            results.update(start_instances([instance_id]))
+        return results
+
+    return {
+        instance["InstanceId"]: {"previous_state": instance["PreviousState"]["Name"]}
+        for instance in response["StartingInstances"]
+    }
+
+
+@serverlog.invocation
 def handler(event, context):
-    logger.info(f"Received event: {event}")
-    ec2.start_instances(InstanceIds=[event.get("instance_id")])
-
-    # Enqueue message to SQS to allow follow-up message
-    sqs.send_message(
-        QueueUrl=os.environ.get("SQS_SERVER_START_URL"),
-        MessageBody=json.dumps(
-            {
-                "application_id": event["application_id"],
-                "application_name": event["application_name"],
-                "token": event["token"],
-            }
-        ),
-    )
+    logger.info("Received event", event="event_received", payload=event)
+    instance_ids = event["instance_ids"]
+    instance_names = event["instance_names"]
+    results = start_instances(instance_ids)
+
+    lines = []
+    starting = []
+    for instance_id in instance_ids:
+        name = instance_names.get(instance_id, instance_id)
+        result = results.get(instance_id, {"error": "not started"})
+        if "error" in result:
+            lines.append(f"{name} server failed to start ({result['error']})")
+        elif result["previous_state"] == "running":
+            lines.append(f"{name} server is already running")
+        else:
+            lines.append(f"{name} server is starting")
+            starting.append(instance_id)
+            # The start itself is recorded by the backup lambda from the EC2
+            # state change
+            sessions.record(
+                name.lower(),
+                "request",
+                action="start",
+                requester=event.get("requester"),
+                instance_id=instance_id,
+            )
+            # Enqueue message to SQS to allow follow-up message
+            sqs.send_message(
+                QueueUrl=os.environ.get("SQS_SERVER_START_URL"),
+                MessageBody=json.dumps(
+                    {
+                        "application_id": event["application_id"],
+                        "application_name": name,
+                        # Matched against the log group by startmsg
+                        "server": name.lower(),
+                        "instance_id": instance_id,
+                        "token": event["token"],
+                        # A group reply lists every server, so announce readiness
+                        # in a new message instead of replacing it
+                        "followup": len(instance_ids) > 1,
+                    }
+                ),
+            )
+
+    # A single server starting keeps the thinking spinner until it is ready
+    if len(instance_ids) > 1 or not starting:
+        resp = requests.patch(
+            f"https://discord.com/api/v10/webhooks/{event['application_id']}/{event['token']}/messages/@original",
+            data={"content": "\n".join(lines)},
+        )
+        logger.info(
+            "Discord response",
+            event="discord_response",
+            status_code=resp.status_code,
+            body=resp.text,
+        )
     return {"statusCode": 200}
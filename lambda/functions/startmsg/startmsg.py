@@ -1,48 +1,120 @@
+import base64
+import gzip
 import json
-import logging
 import os
+import time
 
 import boto3
 import requests
 
+import serverlog
+import sessions
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+
+logger = serverlog.get_logger()
 
 sqs = boto3.client("sqs")
 
+# Long poll each receive, so SQS checks all of its hosts for messages
+RECEIVE_WAIT_SECONDS = 1
+# Messages for other servers are hidden this long while the queue is read
+RECEIVE_VISIBILITY_SECONDS = 10
+# How long to keep looking for the server's message, e.g. while another
+# server's invocation is holding it, within the 30 second Lambda timeout
+FIND_SECONDS = 20
+
+
+def log_group_server(event: dict) -> str | None:
+    """Server name from the log group of a log subscription event, e.g.
+    /aws/ec2/valheim."""
+    try:
+        data = json.loads(gzip.decompress(base64.b64decode(event["awslogs"]["data"])))
+    except (KeyError, ValueError, OSError):
+        return None
+    return data["logGroup"].rsplit("/", 1)[-1]
+
+
+def receive_server_messages(queue_url: str, server: str | None) -> list[dict]:
+    """Read the queue until it is empty and return the messages for `server`.
+    Messages for other servers are held until the queue is empty and then made
+    visible again.  If there is none for `server`, another invocation may be
+    holding it, so try again until FIND_SECONDS have passed."""
+    deadline = time.monotonic() + FIND_SECONDS
+    while True:
+        found, held = [], []
+        while True:
+            sqs_resp = sqs.receive_message(
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=10,
+                WaitTimeSeconds=RECEIVE_WAIT_SECONDS,
+                VisibilityTimeout=RECEIVE_VISIBILITY_SECONDS,
+            )
+            sqs_messages = sqs_resp.get("Messages", [])
+            if not sqs_messages:
+                break
+            logger.info("Fetched %s message(s)", len(sqs_messages))
+            for sqs_message in sqs_messages:
+                if json.loads(sqs_message["Body"]).get("server") == server:
+                    found.append(sqs_message)
+                else:
+                    held.append(sqs_message)
+
+        for sqs_message in held:
+            sqs.change_message_visibility(
+                QueueUrl=queue_url,
+                ReceiptHandle=sqs_message["ReceiptHandle"],
+                VisibilityTimeout=0,
+            )
+        if found or server is None or time.monotonic() >= deadline:
+            return found
+        time.sleep(RECEIVE_WAIT_SECONDS)
 
+
+@serverlog.invocation
 def handler(event, context):
     """SQS is used as a temporary storage space to bridge the gap between a
-    Discord app sending a start command and an event-driven response. A
-    queue is not the ideal solution since there is a race condition between
-    multiple invocations from different servers. It would be better to use
-    Redis and store the sender's token by instance id. That costs money to
-    maintain though, whereas this has negligible cost. The race condition
-    could be mitigated by requeuing if it were a real concern.
+    Discord app sending a start command and an event-driven response. Each
+    message names the server it is waiting for, so only the messages for the
+    server whose log reported readiness are answered and deleted.  The others
+    are made visible again for the next server's invocation.
     """
-    logger.info(f"Received event: {event}")
+    logger.info("Received event", event="event_received", payload=event)
+
+    server = log_group_server(event)
+    if server:
+        sessions.record(server, "ready")
 
     # Pull from queue to update message here
-    sqs_resp = sqs.receive_message(
-        QueueUrl=os.environ.get("SQS_SERVER_START_URL"),
-        MaxNumberOfMessages=10,
-    )
-
-    last_msg = None
-    if sqs_resp:
-        logger.info("Fetched %s message(s)", len(sqs_resp["Messages"]))
-        for sqs_message in sqs_resp["Messages"]:
-            last_msg = json.loads(sqs_message["Body"])
-
-    if last_msg:
-        logger.info("Updating Discord message")
-        resp = requests.patch(
-            f"https://discord.com/api/v10/webhooks/{last_msg['application_id']}/{last_msg['token']}/messages/@original",
-            data={
-                "content": f"{last_msg['application_name']} server is ready",
-            },
-        )
+    queue_url = os.environ.get("SQS_SERVER_START_URL")
+    sqs_messages = receive_server_messages(queue_url, server)
+    if not sqs_messages:
+        logger.warning("No start message for %s", server)
 
-    logger.info(f"Discord response ({resp.status_code}): {resp.json()}")
+    for sqs_message in sqs_messages:
+        msg = json.loads(sqs_message["Body"])
+        if msg.get("followup"):
+            logger.info("Sending Discord follow-up message")
+            resp = requests.post(
+                f"https://discord.com/api/v10/webhooks/{msg['application_id']}/{msg['token']}",
+                data={
+                    "content": f"{msg['application_name']} server is ready",
+                },
+            )
+        else:
+            logger.info("Updating Discord message")
+            resp = requests.patch(
+                f"https://discord.com/api/v10/webhooks/{msg['application_id']}/{msg['token']}/messages/@original",
+                data={
+                    "content": f"{msg['application_name']} server is ready",
+                },
+            )
+        logger.info(
+            "Discord response",
+            event="discord_response",
+            status_code=resp.status_code,
+            body=resp.text,
+        )
+        sqs.delete_message(
+            QueueUrl=queue_url, ReceiptHandle=sqs_message["ReceiptHandle"]
+        )
     return {"statusCode": 200}
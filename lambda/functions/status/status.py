@@ -1,34 +1,244 @@
-import logging
+import asyncio
 import os
+import struct
+import time
 
 import boto3
 import requests
 
+import serverlog
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
+logger = serverlog.get_logger()
 
-def handler(event, context):
-    logger.info(f"Received event: {event}")
-    instance_id = event.get("instance_id")
-    server = boto3.resource("ec2").Instance(instance_id)
+PROJECT_TAG_KEY = "project"
+# Steam query (A2S) port for each game server, keyed by the instance project tag.
+# Valheim answers on game port + 1.
+QUERY_PORTS = {
+    "moria": 7777,
+    "valheim": 2457,
+}
+# All servers are queried concurrently and must answer within this budget, leaving
+# the rest of the Lambda time for EC2 and Discord calls.
+QUERY_BUDGET_SECONDS = 0.8
+
+A2S_HEADER = b"\xff\xff\xff\xff"
+A2S_INFO = A2S_HEADER + b"TSource Engine Query\x00"
+A2S_PLAYER = A2S_HEADER + b"U"
+A2S_CHALLENGE = 0x41  # "A"
+A2S_INFO_RESPONSE = 0x49  # "I"
+A2S_PLAYER_RESPONSE = 0x44  # "D"
+
+
+class A2SProtocol(asyncio.DatagramProtocol):
+    """Single UDP socket speaking the request/response half of the Steam server
+    query protocol.  Only one request is in flight at a time."""
+
+    def __init__(self):
+        self.transport = None
+        self.response = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.response and not self.response.done():
+            self.response.set_result(data)
+
+    def error_received(self, exc):
+        if self.response and not self.response.done():
+            self.response.set_exception(exc)
+
+    async def request(self, payload: bytes) -> bytes:
+        """Send a query, answering a challenge if the server issues one."""
+        for _ in range(2):
+            self.response = asyncio.get_running_loop().create_future()
+            self.transport.sendto(payload)
+            data = await self.response
+            if data[:4] != A2S_HEADER:
+                raise ValueError("Split or malformed A2S response")
+            if data[4] != A2S_CHALLENGE:
+                return data[4:]
+            challenge = data[5:9]
+            if payload.startswith(A2S_PLAYER):
+                payload = A2S_PLAYER + challenge
+            else:
+                payload = A2S_INFO + challenge
+        raise ValueError("A2S challenge not accepted")
 
-    if server:
+
+def read_string(data: bytes, offset: int) -> tuple[str, int]:
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode("utf-8", errors="replace"), end + 1
+
+
+def parse_info(data: bytes) -> dict:
+    """Parse an A2S_INFO response body (after the 0xFFFFFFFF header)."""
+    if data[0] != A2S_INFO_RESPONSE:
+        raise ValueError(f"Unexpected A2S_INFO response type {data[0]:#x}")
+    offset = 2  # Type and protocol version
+    name, offset = read_string(data, offset)
+    world, offset = read_string(data, offset)
+    _, offset = read_string(data, offset)  # Folder
+    _, offset = read_string(data, offset)  # Game
+    offset += 2  # Steam app id
+    players, max_players = struct.unpack_from("<BB", data, offset)
+    return {
+        "name": name,
+        "world": world,
+        "players": players,
+        "max_players": max_players,
+    }
+
+
+def parse_players(data: bytes) -> list[str]:
+    """Parse an A2S_PLAYER response body into player names."""
+    if data[0] != A2S_PLAYER_RESPONSE:
+        raise ValueError(f"Unexpected A2S_PLAYER response type {data[0]:#x}")
+    names = []
+    offset = 2  # Type and player count
+    for _ in range(data[1]):
+        offset += 1  # Index
+        name, offset = read_string(data, offset)
+        offset += 8  # Score and duration
+        if name:
+            names.append(name)
+    return names
+
+
+async def query_server(
+    host: str, port: int, timeout: float = QUERY_BUDGET_SECONDS
+) -> dict:
+    """Query A2S_INFO and A2S_PLAYER for a single server within `timeout`
+    seconds.  A server that answers A2S_INFO but not A2S_PLAYER in time is
+    reported without player names."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    transport, protocol = await loop.create_datagram_endpoint(
+        A2SProtocol, remote_addr=(host, port)
+    )
+    try:
+        started = time.perf_counter()
+        info = parse_info(await asyncio.wait_for(protocol.request(A2S_INFO), timeout))
+        info["latency_ms"] = (time.perf_counter() - started) * 1000
         try:
-            describe_response = boto3.client("ec2").describe_instance_status(
-                InstanceIds=[instance_id]
+            info["player_names"] = parse_players(
+                await asyncio.wait_for(
+                    protocol.request(A2S_PLAYER + A2S_HEADER),
+                    deadline - loop.time(),
+                )
+            )
+        except asyncio.TimeoutError:
+            logger.warning("No A2S_PLAYER answer from %s:%s", host, port)
+        except (ValueError, IndexError, struct.error) as ex:
+            logger.warning("Unparseable A2S_PLAYER from %s:%s: %s", host, port, ex)
+        return info
+    finally:
+        transport.close()
+
+
+async def query_servers(
+    targets: dict[str, tuple[str, int]], budget: float = QUERY_BUDGET_SECONDS
+) -> dict[str, dict | None]:
+    """Query every target concurrently.  Servers that fail or have not answered
+    A2S_INFO within the budget map to None."""
+    answers = await asyncio.gather(
+        *(query_server(host, port, budget) for host, port in targets.values()),
+        return_exceptions=True,
+    )
+
+    results = {}
+    for key, answer in zip(targets, answers):
+        if isinstance(answer, asyncio.TimeoutError):
+            results[key] = None
+        elif isinstance(answer, Exception):
+            logger.warning("A2S query failed for %s: %s", key, answer)
+            results[key] = None
+        else:
+            results[key] = answer
+    return results
+
+
+def describe_servers(ec2) -> list[dict]:
+    """Describe all game server instances, identified by their project tag."""
+    response = ec2.describe_instances(
+        Filters=[{"Name": f"tag:{PROJECT_TAG_KEY}", "Values": list(QUERY_PORTS)}]
+    )
+    servers = []
+    for reservation in response["Reservations"]:
+        for instance in reservation["Instances"]:
+            tags = {tag["Key"]: tag["Value"] for tag in instance.get("Tags", [])}
+            servers.append(
+                {
+                    "instance_id": instance["InstanceId"],
+                    "game": tags[PROJECT_TAG_KEY],
+                    "state": instance["State"]["Name"],
+                    "public_ip": instance.get("PublicIpAddress"),
+                }
+            )
+    return sorted(servers, key=lambda server: server["game"])
+
+
+def format_status(server: dict, health: str | None, live: dict | None) -> str:
+    status = f"{server['game'].capitalize()} is {server['state']}"
+    if health:
+        status += f" ({health})"
+    if server["state"] != "running":
+        return status
+    if live is None:
+        return f"{status}, game not responding"
+    status += (
+        f", {live['players']}/{live['max_players']} players on {live['world']}"
+        f" ({live['latency_ms']:.0f} ms)"
+    )
+    if live.get("player_names"):
+        status += f": {', '.join(live['player_names'])}"
+    return status
+
+
+@serverlog.invocation
+def handler(event, context):
+    logger.info("Received event", event="event_received", payload=event)
+    ec2 = boto3.client("ec2")
+    servers = describe_servers(ec2)
+
+    health_checks = {}
+    if servers:
+        describe_response = ec2.describe_instance_status(
+            InstanceIds=[server["instance_id"] for server in servers]
+        )
+        for instance_status in describe_response["InstanceStatuses"]:
+            health_checks[instance_status["InstanceId"]] = instance_status[
+                "InstanceStatus"
+            ]["Status"]
+
+    targets = {
+        server["instance_id"]: (server["public_ip"], QUERY_PORTS[server["game"]])
+        for server in servers
+        if server["state"] == "running" and server["public_ip"]
+    }
+    live = asyncio.run(query_servers(targets))
+
+    if servers:
+        content = "\n".join(
+            format_status(
+                server,
+                health_checks.get(server["instance_id"]),
+                live.get(server["instance_id"]),
             )
-            health_check = f" ({describe_response["InstanceStatuses"][0]["InstanceStatus"]["Status"]})"
-        except (IndexError, KeyError):
-            health_check = ""
-        status = f"{server.state.get("Name")}{health_check}"
+            for server in servers
+        )
     else:
-        status = f"missing, server instance {instance_id} not found."
+        content = "No game server instances found."
 
     resp = requests.patch(
         f"https://discord.com/api/v10/webhooks/{event['application_id']}/{event['token']}/messages/@original",
-        data={"content": f"{event['application_name']} is {status}"},
+        data={"content": content},
+    )
+    logger.info(
+        "Discord response",
+        event="discord_response",
+        status_code=resp.status_code,
+        body=resp.text,
     )
-    logger.info(f"Discord response ({resp.status_code}): {resp.json()}")
     return {"statusCode": 200}
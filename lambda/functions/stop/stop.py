@@ -1,25 +1,74 @@
-import logging
 import os
 
 import boto3
 import requests
+from botocore.exceptions import ClientError
 
+import serverlog
+import sessions
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
+logger = serverlog.get_logger()
+
+ec2 = boto3.client("ec2")
 ecs = boto3.client("ecs")
 
 
+def stop_instances(instance_ids: list[str]) -> dict[str, dict]:
+    """Stop all instances with one StopInstances call.  EC2 rejects the whole
+    call if any instance cannot be stopped, so fall back to one call per
+    instance to find out which ones failed."""
+    try:
+        response = ec2.stop_instances(InstanceIds=instance_ids)
+    except ClientError as ex:
+        if len(instance_ids) == 1:
+            return {instance_ids[0]: {"error": ex.response["Error"]["Code"]}}
+        logger.warning("Batched stop failed, stopping one at a time: %s", ex)
+        results = {}
+        for instance_id in instance_ids:
+            results.update(stop_instances([instance_id]))
+        return results
+
+    return {
+        instance["InstanceId"]: {"previous_state": instance["PreviousState"]["Name"]}
+        for instance in response["StoppingInstances"]
+    }
+
+
+@serverlog.invocation
 def handler(event, context):
-    logger.info(f"Received event: {event}")
-    server = boto3.resource("ec2").Instance(event.get("instance_id"))
-    server.stop()
+    logger.info("Received event", event="event_received", payload=event)
+    instance_ids = event["instance_ids"]
+    instance_names = event["instance_names"]
+    results = stop_instances(instance_ids)
+
+    lines = []
+    for instance_id in instance_ids:
+        name = instance_names.get(instance_id, instance_id)
+        result = results.get(instance_id, {"error": "not stopped"})
+        if "error" in result:
+            lines.append(f"{name} server failed to stop ({result['error']})")
+        else:
+            lines.append(f"{name} server is stopped")
+            if result["previous_state"] in ("pending", "running"):
+                sessions.record(
+                    name.lower(),
+                    "request",
+                    action="stop",
+                    requester=event.get("requester"),
+                    instance_id=instance_id,
+                )
+
     resp = requests.patch(
         f"https://discord.com/api/v10/webhooks/{event['application_id']}/{event['token']}/messages/@original",
         data={
-            "content": f"{event['application_name']} server is stopped",
+            "content": "\n".join(lines),
         },
     )
-    logger.info(f"Discord response ({resp.status_code}): {resp.json()}")
+    logger.info(
+        "Discord response",
+        event="discord_response",
+        status_code=resp.status_code,
+        body=resp.text,
+    )
     return {"statusCode": 200}
@@ -1,11 +1,11 @@
-import logging
 import os
 
 import boto3
 
+import serverlog
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+
+logger = serverlog.get_logger()
 
 
 ec2 = boto3.client("ec2")
@@ -45,14 +45,21 @@ def upsert_route53_recordset(hosted_zone_id: str, domain: str, public_ip: str) -
             "Changes": [change],
         },
     )
-    logger.info(f"Route53 response: {response}")
+    logger.info(
+        "Route53 change",
+        event="route53_change",
+        domain=domain,
+        change_id=response["ChangeInfo"]["Id"],
+        status=response["ChangeInfo"]["Status"],
+    )
 
     if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
         return True
 
 
+@serverlog.invocation
 def handler(event, context):
-    logger.info("Received event: %s", event)
+    logger.info("Received event", event="event_received", payload=event)
     instance_id = event["detail"]["instance-id"]
     desc = ec2.describe_instances(InstanceIds=[instance_id])
     try:
@@ -70,7 +77,13 @@ def handler(event, context):
     )
 
     if success:
-        logger.info(f"Successfully updated DNS for {instance_id} to {public_ip}")
+        logger.info(
+            "Updated DNS",
+            event="dns_updated",
+            instance_id=instance_id,
+            domain=domain,
+            public_ip=public_ip,
+        )
         return {"statusCode": 200}
 
     raise Exception(f"Failed to update DNS")
@@ -0,0 +1,180 @@
+"""
+Structured logging for the server lambdas.
+
+Shipped in the lambda layer.  Each record is written as one JSON object, so
+CloudWatch Logs Insights can filter on its fields:
+
+    logger = serverlog.get_logger()
+    logger.info("Received event", event="event_received", payload=event)
+    logger.warning("Batched start failed: %s", ex)
+
+Keyword arguments become fields of the record.  The message is formatted and
+the fields are serialized only when the record is emitted.  Values under keys
+such as token, authorization or signature are redacted at any depth.  Records
+with an `event` name in SAMPLE_RATES are kept at that rate, which is added to
+the record so counts can be scaled back up.  The decision is made once per
+invocation of a handler decorated with `invocation`, so a sampled invocation
+keeps all of its records:
+
+    @serverlog.invocation
+    def handler(event, context):
+        ...
+
+The LOG_LEVEL environment variable sets the level, and LOG_SAMPLE_RATES
+overrides sample rates, e.g. `event_received=1,discord_response=0.5`.
+
+"""
+
+import functools
+import json
+import logging
+import os
+import random
+
+
+REDACTED = "[redacted]"
+# Keys whose values are never logged, matched case-insensitively as substrings
+SENSITIVE_KEYS = ("authorization", "password", "secret", "signature", "token")
+CONTAINERS = (dict, list, tuple)
+# Verbose payload events shared by the handlers, kept at these rates
+SAMPLE_RATES = {
+    "discord_response": 0.1,
+    "event_received": 0.1,
+    "interaction_request": 0.1,
+}
+
+# Draw compared with the sample rates, shared by all records of an invocation
+_sample = random.random()
+
+
+@functools.lru_cache(maxsize=1024)
+def is_sensitive(key) -> bool:
+    key = str(key).lower()
+    return any(sensitive in key for sensitive in SENSITIVE_KEYS)
+
+
+def redact(value):
+    """Value with sensitive values replaced.  Containers are copied only where
+    something is redacted, so a value without sensitive keys is returned as
+    is."""
+    if isinstance(value, dict):
+        redacted = None
+        for key, item in value.items():
+            if is_sensitive(key):
+                new = REDACTED
+            elif isinstance(item, CONTAINERS):
+                new = redact(item)
+            else:
+                continue
+            if new is not item:
+                if redacted is None:
+                    redacted = dict(value)
+                redacted[key] = new
+        return value if redacted is None else redacted
+    if isinstance(value, (list, tuple)):
+        redacted = None
+        for index, item in enumerate(value):
+            if not isinstance(item, CONTAINERS):
+                continue
+            new = redact(item)
+            if new is not item:
+                if redacted is None:
+                    redacted = list(value)
+                redacted[index] = new
+        return value if redacted is None else redacted
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = str(record.msg)
+        if record.args:
+            args = record.args if isinstance(record.args, tuple) else (record.args,)
+            message = message % tuple(redact(arg) for arg in args)
+        entry = {
+            "level": record.levelname,
+            "logger": record.name,
+            "message": message,
+        }
+        request_id = getattr(record, "aws_request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        if getattr(record, "event", None):
+            entry["event"] = record.event
+        if getattr(record, "sample_rate", 1.0) < 1.0:
+            entry["sample_rate"] = record.sample_rate
+        entry.update(redact(getattr(record, "fields", {})))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger that takes fields as keyword arguments and samples named events."""
+
+    def __init__(self, logger: logging.Logger, sample_rates: dict[str, float]):
+        super().__init__(logger, {})
+        self.sample_rates = sample_rates
+
+    def log(
+        self,
+        level: int,
+        msg,
+        *args,
+        event: str | None = None,
+        exc_info=None,
+        stack_info: bool = False,
+        **fields,
+    ):
+        if not self.logger.isEnabledFor(level):
+            return
+        sample_rate = self.sample_rates.get(event, 1.0)
+        if sample_rate < 1.0 and _sample >= sample_rate:
+            return
+        self.logger.log(
+            level,
+            msg,
+            *args,
+            exc_info=exc_info,
+            stack_info=stack_info,
+            extra={"event": event, "fields": fields, "sample_rate": sample_rate},
+        )
+
+
+def invocation(handler):
+    """Decorator for lambda handlers that makes a new sampling decision for each
+    invocation."""
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        global _sample
+        _sample = random.random()
+        return handler(*args, **kwargs)
+
+    return wrapper
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+def get_logger(
+    name: str | None = None, sample_rates: dict[str, float] | None = None
+) -> StructuredLogger:
+    """Structured logger, formatting all output of the root logger as JSON."""
+    root = logging.getLogger()
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler())
+    for handler in root.handlers:
+        if not isinstance(handler.formatter, JsonFormatter):
+            handler.setFormatter(JsonFormatter())
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
+    rates = {**SAMPLE_RATES, **(sample_rates or {})}
+    rates.update(parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", "")))
+    return StructuredLogger(logging.getLogger(name), rates)
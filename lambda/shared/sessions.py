@@ -0,0 +1,170 @@
+"""
+Append-only store of server session events.
+
+Shipped in the lambda layer and with the on-instance scripts.  Each event is
+one small record:
+
+    {"server": "valheim", "at": 1760000000000, "event": "request",
+     "action": "start", "requester": "viking",
+     "instance_id": "i-000a7e7cda25c4842"}
+
+`at` is milliseconds since the epoch.  Events are:
+
+* request: `requester` asked Discord to start or stop the server (`action`),
+  written by the start and stop lambdas
+* start, stop: the instance entered the running or stopped state, however it
+  was started, written by the backup lambda from EC2 state changes
+* ready: the server logged that it is accepting players
+* active, idle: the number of connected `players` changed, written by the
+  on-instance watchdog
+
+Events are appended to the DynamoDB table named by SESSION_TABLE_NAME, keyed by
+server and time.  `FileStore` keeps the same records in a JSON lines file for
+tests and local reports.  tools/sessions_report.py aggregates the events.
+
+"""
+
+import json
+import logging
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+# Plain logging, so the on-instance scripts can use this module as well
+logger = logging.getLogger(__name__)
+
+EVENTS = {"request", "start", "stop", "ready", "active", "idle"}
+# Optional fields stored with an event
+FIELDS = ("action", "requester", "instance_id", "players")
+
+
+def make_event(server: str, event: str, at: int | None = None, **fields) -> dict:
+    if event not in EVENTS:
+        raise ValueError(f"Unknown session event: {event}")
+    record = {
+        "server": server,
+        "at": at if at is not None else int(time.time() * 1000),
+        "event": event,
+    }
+    record.update({key: fields[key] for key in FIELDS if fields.get(key) is not None})
+    return record
+
+
+class FileStore:
+    """Events as JSON lines in a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, record: dict):
+        with open(self.path, "a") as fp:
+            fp.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def scan(self, server: str | None = None, since: int = 0):
+        try:
+            with open(self.path) as fp:
+                for line in fp:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if server not in (None, record["server"]):
+                        continue
+                    if record["at"] >= since:
+                        yield record
+        except FileNotFoundError:
+            return
+
+
+class DynamoDBStore:
+    """Events in a DynamoDB table with partition key `server` and numeric sort
+    key `at`."""
+
+    def __init__(self, table_name: str, client=None):
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb")
+
+    def append(self, record: dict):
+        item = {
+            "server": {"S": record["server"]},
+            "at": {"N": str(record["at"])},
+            "event": {"S": record["event"]},
+        }
+        for key in FIELDS:
+            if key in record:
+                value = record[key]
+                item[key] = {"N": str(value)} if key == "players" else {"S": value}
+        # Never overwrite an event, move a colliding one to the next millisecond
+        for _ in range(10):
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item=item,
+                    ConditionExpression="attribute_not_exists(#at)",
+                    ExpressionAttributeNames={"#at": "at"},
+                )
+                return
+            except ClientError as ex:
+                if ex.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                item["at"] = {"N": str(int(item["at"]["N"]) + 1)}
+        raise RuntimeError(f"No free timestamp for {record}")
+
+    def scan(self, server: str | None = None, since: int = 0):
+        if server:
+            paginator = self.client.get_paginator("query")
+            pages = paginator.paginate(
+                TableName=self.table_name,
+                KeyConditionExpression="#server = :server AND #at >= :since",
+                ExpressionAttributeNames={"#server": "server", "#at": "at"},
+                ExpressionAttributeValues={
+                    ":server": {"S": server},
+                    ":since": {"N": str(since)},
+                },
+            )
+        else:
+            paginator = self.client.get_paginator("scan")
+            pages = paginator.paginate(
+                TableName=self.table_name,
+                FilterExpression="#at >= :since",
+                ExpressionAttributeNames={"#at": "at"},
+                ExpressionAttributeValues={":since": {"N": str(since)}},
+            )
+        for page in pages:
+            for item in page["Items"]:
+                record = {}
+                for key, value in item.items():
+                    if "N" in value:
+                        record[key] = int(value["N"])
+                    else:
+                        record[key] = value["S"]
+                yield record
+
+
+def open_store(location: str | None = None):
+    """DynamoDB store for a table name, or file store for a path ending in
+    .jsonl.  Defaults to SESSION_TABLE_NAME."""
+    location = location or os.environ.get("SESSION_TABLE_NAME")
+    if not location:
+        return None
+    if location.endswith(".jsonl"):
+        return FileStore(location)
+    return DynamoDBStore(location)
+
+
+_store = None
+
+
+def record(server: str, event: str, **fields):
+    """Append an event to the default store.  Failures are logged and never
+    fail the caller."""
+    global _store
+    try:
+        _store = _store or open_store()
+        if _store is None:
+            return
+        _store.append(make_event(server, event, **fields))
+    except Exception as ex:
+        logger.error("Could not record session event %s: %s", event, ex)
@@ -15,6 +15,11 @@ import argparse
 import requests
 
 
+# Server groups a command can target, keep in sync with SERVER_GROUPS in
+# lambda/functions/discord/discord.py
+GROUPS = ["all"]
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -47,6 +52,13 @@ if __name__ == "__main__":
                     {"name": "stop", "value": "stop"},
                 ],
             },
+            {
+                "name": "group",
+                "description": "Control a group of servers instead",
+                "type": 3,
+                "required": False,
+                "choices": [{"name": group, "value": group} for group in GROUPS],
+            },
         ],
     }
     r = requests.post(url, headers=headers, json=json)
@@ -0,0 +1,282 @@
+"""
+Boot agent for the game server instances.
+
+Installed to /opt/servers by the stack's user data and started on every boot by
+the servers-boot-agent systemd unit.  Runs the boot steps for one game, starting
+each step as soon as the steps it requires have finished, and skipping work that
+is already done.  Publishes a timing report for each step to CloudWatch.
+
+    python3 /opt/servers/boot_agent.py --game valheim
+
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+import boto3
+
+import moria_launcher
+from moria_launcher import EFS_MOUNT, run
+
+
+logger = logging.getLogger("boot_agent")
+
+STEAMCMD = "/usr/games/steamcmd"
+STEAM_USER = "steam"
+METRIC_NAMESPACE = "GameServers/Boot"
+
+VALHEIM_APP_ID = "896660"
+VALHEIM_INSTALL_DIR = "/home/steam/valheim"
+VALHEIM_SERVICE = "valheim.service"
+
+
+class StepSkipped(Exception):
+    """Raised by a step when there is nothing to do."""
+
+
+class Step:
+    """A boot step.  `func` is called with the values returned by the steps it
+    requires as keyword arguments named after those steps.  Steps that return
+    None or are skipped pass nothing.  Steps named in `after` only have to
+    finish first, and may fail."""
+
+    def __init__(
+        self,
+        name: str,
+        func,
+        requires: tuple[str, ...] = (),
+        after: tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.func = func
+        self.requires = requires
+        self.after = after
+
+
+def mount_efs():
+    if os.path.ismount(EFS_MOUNT):
+        raise StepSkipped(f"{EFS_MOUNT} already mounted")
+    run(["mount", EFS_MOUNT])
+
+
+def installed_build_id(app_id: str, install_dir: str) -> str | None:
+    """Build id from the Steam app manifest of an installed app."""
+    manifest = os.path.join(install_dir, "steamapps", f"appmanifest_{app_id}.acf")
+    try:
+        with open(manifest) as fp:
+            match = re.search(r'"buildid"\s+"(\d+)"', fp.read())
+    except FileNotFoundError:
+        return None
+    return match.group(1) if match else None
+
+
+def latest_build_id(app_id: str) -> str | None:
+    """Build id of the public branch according to Steam."""
+    output = run(
+        [
+            "sudo",
+            "-u",
+            STEAM_USER,
+            STEAMCMD,
+            "+login",
+            "anonymous",
+            "+app_info_update",
+            "1",
+            "+app_info_print",
+            app_id,
+            "+quit",
+        ]
+    )
+    match = re.search(r'"public"\s*\{\s*"buildid"\s*"(\d+)"', output)
+    return match.group(1) if match else None
+
+
+def update_valheim():
+    """Update and validate the Valheim install unless it is already current."""
+    installed = installed_build_id(VALHEIM_APP_ID, VALHEIM_INSTALL_DIR)
+    if installed and installed == latest_build_id(VALHEIM_APP_ID):
+        raise StepSkipped(f"build {installed} is current")
+    run(
+        [
+            "sudo",
+            "-u",
+            STEAM_USER,
+            STEAMCMD,
+            "+force_install_dir",
+            VALHEIM_INSTALL_DIR,
+            "+login",
+            "anonymous",
+            "+app_update",
+            VALHEIM_APP_ID,
+            "validate",
+            "+quit",
+        ]
+    )
+
+
+def start_valheim():
+    run(["systemctl", "start", VALHEIM_SERVICE])
+
+
+def start_moria() -> tuple[int, int] | None:
+    """Start the Moria container from EBS, reusing it if it already exists.
+    Returns the game log position from before the start."""
+    return moria_launcher.launch()
+
+
+def moria_ready(start_game: tuple[int, int] | None = None):
+    moria_launcher.wait_ready(start_game)
+
+
+GAME_STEPS = {
+    "moria": [
+        Step("mount_efs", mount_efs),
+        Step("start_game", start_moria, requires=("mount_efs",)),
+        Step("game_ready", moria_ready, requires=("start_game",)),
+    ],
+    "valheim": [
+        Step("mount_efs", mount_efs),
+        Step("update_game", update_valheim),
+        # A failed update, e.g. during a Steam outage, still starts the
+        # installed build
+        Step(
+            "start_game",
+            start_valheim,
+            requires=("mount_efs",),
+            after=("update_game",),
+        ),
+    ],
+}
+
+
+def timed(step: Step, inputs: dict) -> tuple[dict, object]:
+    """Run a step, returning its report and its return value."""
+    started = time.perf_counter()
+    value = None
+    try:
+        value = step.func(**inputs)
+        status, detail = "ok", ""
+    except StepSkipped as ex:
+        status, detail = "skipped", str(ex)
+    except Exception as ex:
+        status, detail = "failed", str(ex)
+    report = {
+        "step": step.name,
+        "status": status,
+        "seconds": round(time.perf_counter() - started, 3),
+        "detail": detail,
+    }
+    return report, value
+
+
+def run_steps(steps: list[Step]) -> list[dict]:
+    """Run steps in parallel as their requirements and `after` steps finish,
+    passing each step the values returned by its requirements.  Steps whose
+    requirements failed are not run."""
+    pending = {step.name: step for step in steps}
+    results = {}
+    values = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        running = {}
+        while pending or running:
+            for name, step in list(pending.items()):
+                if any(
+                    required not in results for required in step.requires + step.after
+                ):
+                    continue
+                del pending[name]
+                failed = [
+                    required
+                    for required in step.requires
+                    if results[required]["status"] == "failed"
+                ]
+                if failed:
+                    results[name] = {
+                        "step": name,
+                        "status": "failed",
+                        "seconds": 0,
+                        "detail": f"requires {', '.join(failed)}",
+                    }
+                    continue
+                inputs = {
+                    required: values[required]
+                    for required in step.requires
+                    if values.get(required) is not None
+                }
+                logger.info("Starting %s", name)
+                running[executor.submit(timed, step, inputs)] = name
+
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                name = running.pop(future)
+                results[name], values[name] = future.result()
+                logger.info("Finished %s", json.dumps(results[name]))
+    return [results[step.name] for step in steps]
+
+
+def publish_report(game: str, results: list[dict], total: float):
+    """Publish step durations as CloudWatch metrics.  Failure to publish never
+    fails the boot."""
+    metric_data = [
+        {
+            "MetricName": "StepDuration",
+            "Dimensions": [
+                {"Name": "Server", "Value": game},
+                {"Name": "Step", "Value": result["step"]},
+                {"Name": "Status", "Value": result["status"]},
+            ],
+            "Value": result["seconds"],
+            "Unit": "Seconds",
+        }
+        for result in results
+    ]
+    metric_data.append(
+        {
+            "MetricName": "BootDuration",
+            "Dimensions": [{"Name": "Server", "Value": game}],
+            "Value": total,
+            "Unit": "Seconds",
+        }
+    )
+    try:
+        boto3.client("cloudwatch").put_metric_data(
+            Namespace=METRIC_NAMESPACE, MetricData=metric_data
+        )
+    except Exception as ex:
+        logger.error("Could not publish boot report: %s", ex)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--game", required=True, choices=sorted(GAME_STEPS))
+    parser.add_argument(
+        "--no-metrics", action="store_true", help="Do not publish to CloudWatch"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    started = time.perf_counter()
+    results = run_steps(GAME_STEPS[args.game])
+    total = round(time.perf_counter() - started, 3)
+
+    logger.info(
+        "Boot report %s",
+        json.dumps({"server": args.game, "seconds": total, "steps": results}),
+    )
+    if not args.no_metrics:
+        publish_report(args.game, results, total)
+
+    if any(result["status"] == "failed" for result in results):
+        sys.exit(1)
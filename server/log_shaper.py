@@ -0,0 +1,227 @@
+"""
+Log shaper for the game server logs.
+
+Tails a game log and writes a reduced copy for the CloudWatch agent to ship.
+Lifecycle lines (readiness, saves, connections) always pass through, configured
+noise is dropped, and repeats of any other line within a window are collapsed
+into a single counted summary.  Memory is bounded by the number of distinct
+lines tracked per window.
+
+Installed to /opt/servers and run by the servers-log-shaper systemd unit.
+
+    python3 /opt/servers/log_shaper.py --game valheim
+    python3 /opt/servers/log_shaper.py --game valheim --benchmark recorded.log
+
+"""
+
+import argparse
+import os
+import re
+import time
+from collections import OrderedDict
+
+
+# Raw game output and the shaped copy shipped to CloudWatch
+GAME_LOGS = {
+    "moria": (
+        "/home/steam/moria/moria-docker/server/Moria/Saved/Logs/Moria.log",
+        "/var/log/servers/moria.log",
+    ),
+    "valheim": ("/var/log/valheim/valheim.log", "/var/log/servers/valheim.log"),
+}
+# Always shipped. Readiness lines feed the startmsg subscription filters and save
+# lines feed the backup subscription filter.
+PASS_THROUGH = {
+    "moria": [
+        r"Started hosting the game",
+        r"[Ss]av(e|ing)",
+        r"[Jj]oin|[Ll]ogin|[Ll]ogout|[Dd]isconnect",
+        r"[Ee]rror|[Ee]xception|[Cc]rash",
+    ],
+    "valheim": [
+        r"Opened Steam server",
+        r"World saved",
+        r"Got connection SteamID|Closing socket|Got character ZDOID",
+        r"Load world|Game server connected",
+        r"[Ee]xception|[Cc]rash",
+    ],
+}
+# Never shipped
+NOISE = {
+    "moria": [
+        r"^\s*$",
+        r"^[0-9a-f]{4}:fixme:",
+        r"LogStreaming|LogTexture|LogMaterial",
+    ],
+    "valheim": [
+        r"^\s*$",
+        r"^\(Filename: .* Line: \d+\)$",
+        r"Fallback handler could not load library",
+        r"The referenced script .* is missing!",
+        r"^Shader '.*' is not supported",
+    ],
+}
+
+WINDOW_SECONDS = 60
+MAX_KEYS = 2048
+POLL_SECONDS = 0.5
+
+TIMESTAMP = re.compile(r"^\[?[\d/:.\- T]+\]?(\[\s*\d+\])?:?\s*")
+NUMBERS = re.compile(r"\d+")
+
+
+class LogShaper:
+    """Decides which lines to ship.  Call `feed` for each line and `flush`
+    periodically to emit repeat summaries."""
+
+    def __init__(
+        self,
+        pass_through: list[str],
+        noise: list[str],
+        emit,
+        window_seconds: float = WINDOW_SECONDS,
+        max_keys: int = MAX_KEYS,
+    ):
+        self.pass_through = re.compile("|".join(f"(?:{p})" for p in pass_through))
+        self.noise = re.compile("|".join(f"(?:{p})" for p in noise))
+        self.emit = emit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        # Normalized line -> [suppressed repeats, first line]
+        self.window = OrderedDict()
+        self.window_started = time.monotonic()
+        self.dropped = 0
+
+    def feed(self, line: str):
+        line = line.rstrip("\n")
+        if self.pass_through.search(line):
+            self.emit(line)
+            return
+        if self.noise.search(line):
+            self.dropped += 1
+            return
+
+        key = NUMBERS.sub("#", TIMESTAMP.sub("", line))
+        seen = self.window.get(key)
+        if seen is not None:
+            seen[0] += 1
+            return
+
+        self.emit(line)
+        self.window[key] = [0, line]
+        if len(self.window) > self.max_keys:
+            self.summarize(*self.window.popitem(last=False)[1])
+
+    def summarize(self, count: int, line: str):
+        if count:
+            self.emit(f"[repeated {count}x] {line}")
+
+    def flush(self, force: bool = False):
+        """Emit repeat summaries and start a new window once the window is over."""
+        now = time.monotonic()
+        if not force and now - self.window_started < self.window_seconds:
+            return
+        for count, line in self.window.values():
+            self.summarize(count, line)
+        if self.dropped:
+            self.emit(f"[dropped {self.dropped} noise lines]")
+        self.window.clear()
+        self.dropped = 0
+        self.window_started = now
+
+
+def follow(path: str, shaper: LogShaper):
+    """Tail a file forever, following rotation and truncation."""
+    started = time.time()
+    fp = None
+    inode = None
+    partial = ""
+    while True:
+        if fp is None:
+            try:
+                fp = open(path, errors="replace")
+            except FileNotFoundError:
+                shaper.flush()
+                time.sleep(POLL_SECONDS)
+                continue
+            stat = os.fstat(fp.fileno())
+            inode = stat.st_ino
+            # Skip output from before we started, but not the start of a log the
+            # game is writing right now, which holds the readiness line
+            if stat.st_mtime < started:
+                fp.seek(0, os.SEEK_END)
+
+        line = fp.readline()
+        if line:
+            partial += line
+            if partial.endswith("\n"):
+                shaper.feed(partial)
+                partial = ""
+            continue
+
+        shaper.flush()
+        time.sleep(POLL_SECONDS)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if stat.st_ino != inode or stat.st_size < fp.tell():
+            # Rotated or truncated, read the new file from the start
+            fp.close()
+            fp = open(path, errors="replace")
+            inode = os.fstat(fp.fileno()).st_ino
+            partial = ""
+
+
+def benchmark(path: str, shaper_args: dict):
+    """Shape a recorded log as fast as possible and report throughput."""
+    shipped = []
+    shaper = LogShaper(emit=shipped.append, **shaper_args)
+    bytes_in = lines_in = 0
+    started = time.perf_counter()
+    with open(path, errors="replace") as fp:
+        for line in fp:
+            lines_in += 1
+            bytes_in += len(line)
+            shaper.feed(line)
+    shaper.flush(force=True)
+    elapsed = time.perf_counter() - started
+
+    bytes_out = sum(len(line) + 1 for line in shipped)
+    print(f"{lines_in} lines in, {len(shipped)} lines out in {elapsed:.2f}s")
+    print(f"{lines_in / elapsed:,.0f} lines/s, {bytes_in / elapsed / 1024**2:.1f} MB/s")
+    print(
+        f"{bytes_in:,} bytes in, {bytes_out:,} bytes out "
+        f"({100 * (1 - bytes_out / max(bytes_in, 1)):.1f}% reduction)"
+    )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--game", required=True, choices=sorted(GAME_LOGS))
+    parser.add_argument("-i", "--input", help="Game log to tail")
+    parser.add_argument("-o", "--output", help="Shaped log to write")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS)
+    parser.add_argument("--max-keys", type=int, default=MAX_KEYS)
+    parser.add_argument("--benchmark", help="Shape a recorded log and report speed")
+    args = parser.parse_args()
+
+    shaper_args = {
+        "pass_through": PASS_THROUGH[args.game],
+        "noise": NOISE[args.game],
+        "window_seconds": args.window,
+        "max_keys": args.max_keys,
+    }
+    if args.benchmark:
+        benchmark(args.benchmark, shaper_args)
+    else:
+        input_path, output_path = GAME_LOGS[args.game]
+        input_path = args.input or input_path
+        output_path = args.output or output_path
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, "a", buffering=1) as output:
+            shaper = LogShaper(
+                emit=lambda line: output.write(line + "\n"), **shaper_args
+            )
+            follow(input_path, shaper)
@@ -0,0 +1,250 @@
+"""
+Launcher for the Return to Moria Docker server.
+
+Keeps the moria-docker compose project, including the server install, on the
+instance's EBS root volume in /opt/moria.  Docker keeps the image and the
+container, with its Wine prefix, in /var/lib/docker on the same volume, and the
+container is reused across boots instead of being recreated.  Only the save
+directory lives on EFS: it is bind mounted over the project's save directory
+before the container starts.
+
+The first launch copies the existing project from EFS, or clones it if there is
+none.  The EFS project is left in place for `--legacy`.
+
+Installed to /opt/servers.  The boot agent calls `launch` and `wait_ready` on
+every boot.  To compare time to ready against the old EFS project, which
+recreates the container on every start:
+
+    python3 /opt/servers/moria_launcher.py
+    python3 /opt/servers/moria_launcher.py --legacy
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+
+logger = logging.getLogger("moria_launcher")
+
+MORIA_DOCKER_REPO = "https://github.com/AndrewSav/moria-docker"
+STEAM_USER = "steam"
+EFS_MOUNT = "/mnt/efs"
+
+# Project on EBS, and the original project on EFS through the /home/steam/moria
+# symlink
+COMPOSE_DIR = "/opt/moria/moria-docker"
+LEGACY_COMPOSE_DIR = "/home/steam/moria/moria-docker"
+# Relative to the project directory
+SAVE_DIR = "server/Moria/Saved"
+LOG_FILE = "server/Moria/Saved/Logs/Moria.log"
+
+READY_LINE = "Started hosting the game"
+READY_TIMEOUT_SECONDS = 20 * 60
+POLL_SECONDS = 0.5
+
+
+def run(command: list[str], **kwargs) -> str:
+    """Run a command, raising with its output if it fails."""
+    result = subprocess.run(command, capture_output=True, text=True, **kwargs)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"{' '.join(command)} exited {result.returncode}: {result.stderr.strip()}"
+        )
+    return result.stdout
+
+
+def install_project():
+    """Create the EBS project from the EFS project, without its saves."""
+    if os.path.isdir(COMPOSE_DIR):
+        return
+    os.makedirs(os.path.dirname(COMPOSE_DIR), exist_ok=True)
+    if os.path.isdir(LEGACY_COMPOSE_DIR):
+        logger.info("Copying %s to %s", LEGACY_COMPOSE_DIR, COMPOSE_DIR)
+        run(
+            [
+                "rsync",
+                "-a",
+                f"--exclude=/{SAVE_DIR}/",
+                f"{LEGACY_COMPOSE_DIR}/",
+                f"{COMPOSE_DIR}/",
+            ]
+        )
+    else:
+        logger.info("Cloning %s to %s", MORIA_DOCKER_REPO, COMPOSE_DIR)
+        run(["git", "clone", MORIA_DOCKER_REPO, COMPOSE_DIR])
+
+
+def efs_save_dir() -> str:
+    """Save directory of the EFS project.  Fails if /home/steam/moria does not
+    lead to the mounted EFS, rather than keeping saves on the root volume."""
+    source = os.path.realpath(os.path.join(LEGACY_COMPOSE_DIR, SAVE_DIR))
+    if not os.path.ismount(EFS_MOUNT):
+        raise RuntimeError(f"{EFS_MOUNT} is not mounted")
+    if os.path.commonpath([source, EFS_MOUNT]) != EFS_MOUNT:
+        raise RuntimeError(
+            f"{LEGACY_COMPOSE_DIR} resolves to {source}, not {EFS_MOUNT}"
+        )
+    return source
+
+
+def saves_mounted() -> bool:
+    return os.path.ismount(os.path.join(COMPOSE_DIR, SAVE_DIR))
+
+
+def mount_saves(source: str):
+    """Bind mount the EFS save directory into the EBS project.  Docker bind
+    mounts the project's server directory recursively, so a container started
+    after this sees the EFS saves."""
+    target = os.path.join(COMPOSE_DIR, SAVE_DIR)
+    if os.path.ismount(target):
+        return
+    for path in (source, target):
+        os.makedirs(path, exist_ok=True)
+        shutil.chown(path, STEAM_USER, STEAM_USER)
+    run(["mount", "--bind", source, target])
+
+
+def container_dirs() -> set[str]:
+    """Project directories of the existing containers for the compose project."""
+    output = run(
+        [
+            "docker",
+            "ps",
+            "--all",
+            "--filter",
+            f"label=com.docker.compose.project={os.path.basename(COMPOSE_DIR)}",
+            "--format",
+            '{{.Label "com.docker.compose.project.working_dir"}}',
+        ]
+    )
+    return set(output.split())
+
+
+def running_containers() -> list[str]:
+    """Ids of the running containers for the compose project."""
+    output = run(
+        [
+            "docker",
+            "ps",
+            "--quiet",
+            "--filter",
+            f"label=com.docker.compose.project={os.path.basename(COMPOSE_DIR)}",
+            "--filter",
+            "status=running",
+        ]
+    )
+    return output.split()
+
+
+def log_mark(compose_dir: str) -> tuple[int, int] | None:
+    """Inode and size of the game log, to find output written after it."""
+    try:
+        stat = os.stat(os.path.join(compose_dir, LOG_FILE))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size
+
+
+def launch(legacy: bool = False) -> tuple[int, int] | None:
+    """Start the server and return the game log mark from before the start."""
+    if legacy:
+        compose_dir, up = LEGACY_COMPOSE_DIR, ["--force-recreate"]
+    else:
+        source = efs_save_dir()
+        install_project()
+        if not saves_mounted():
+            # Docker may have started the container at boot, through its
+            # restart policy, before the saves were mounted.  It would keep
+            # saving to the root volume, and up does not touch a running
+            # container.
+            containers = running_containers()
+            if containers:
+                logger.info("Stopping container started without the EFS saves")
+                run(["docker", "stop", *containers])
+            mount_saves(source)
+        compose_dir, up = COMPOSE_DIR, ["--no-recreate"]
+        # Both projects share a name, so a container created from the other
+        # project has the wrong mounts
+        if container_dirs() - {COMPOSE_DIR}:
+            logger.info("Recreating container created from another project")
+            up = ["--force-recreate"]
+
+    mark = log_mark(compose_dir)
+    run(["docker", "compose", "up", "-d", *up], cwd=compose_dir)
+    return mark
+
+
+def wait_ready(
+    mark: tuple[int, int] | None,
+    compose_dir: str = COMPOSE_DIR,
+    timeout: float = READY_TIMEOUT_SECONDS,
+):
+    """Wait for the ready line in game log output written after `mark`.  The
+    game rotates its log on start, so a new file is read from the start."""
+    path = os.path.join(compose_dir, LOG_FILE)
+    deadline = time.monotonic() + timeout
+    inode, offset = mark or (None, 0)
+    partial = ""
+    while time.monotonic() < deadline:
+        try:
+            with open(path, errors="replace") as fp:
+                if os.fstat(fp.fileno()).st_ino != inode:
+                    inode, offset, partial = os.fstat(fp.fileno()).st_ino, 0, ""
+                fp.seek(offset)
+                partial += fp.read()
+                offset = fp.tell()
+        except FileNotFoundError:
+            pass
+        if READY_LINE in partial:
+            return
+        # Keep a possibly incomplete last line for the next read
+        partial = partial[partial.rfind("\n") + 1 :]
+        time.sleep(POLL_SECONDS)
+    raise TimeoutError(f"{READY_LINE!r} not logged within {timeout:.0f}s")
+
+
+def measure(legacy: bool) -> dict:
+    """Stop the server, start it again and time how long until it is hosting."""
+    compose_dir = LEGACY_COMPOSE_DIR if legacy else COMPOSE_DIR
+    if os.path.isdir(compose_dir):
+        run(["docker", "compose", "stop"], cwd=compose_dir)
+
+    started = time.perf_counter()
+    mark = launch(legacy)
+    launched = time.perf_counter()
+    wait_ready(mark, compose_dir)
+    ready = time.perf_counter()
+    return {
+        "setup": "legacy" if legacy else "ebs",
+        "compose_dir": compose_dir,
+        "launch_seconds": round(launched - started, 3),
+        "ready_seconds": round(ready - started, 3),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="Start from the EFS project, recreating the container",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    result = measure(args.legacy)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(
+            f"{result['setup']}: started in {result['launch_seconds']:.1f}s, "
+            f"hosting after {result['ready_seconds']:.1f}s"
+        )
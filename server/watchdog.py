@@ -0,0 +1,324 @@
+"""
+Memory watchdog for the game server process.
+
+Samples the game process from /proc (resident and swapped memory, CPU, major
+page faults) along with system memory pressure (PSI), which rises when the
+game's garbage collector starts thrashing, and publishes the samples as
+CloudWatch metrics.  When memory stays over its thresholds the watchdog plans a
+restart, waits until no players are connected, announces it to Discord and
+restarts the game.
+
+Installed to /opt/servers and run by the servers-watchdog systemd unit.
+
+    python3 /opt/servers/watchdog.py --game valheim
+
+The Discord announcement is posted to the channel webhook URL stored in the SSM
+parameter named by DISCORD_WEBHOOK_PARAMETER, if it exists.
+
+Changes in the number of connected players are appended as active and idle
+events to the session table named by SESSION_TABLE_NAME through sessions.py,
+which the user data installs next to this script from lambda/shared.
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import struct
+import subprocess
+import time
+import urllib.request
+
+import boto3
+
+import moria_launcher
+import sessions
+
+
+logger = logging.getLogger("watchdog")
+
+METRIC_NAMESPACE = "GameServers/Process"
+DISCORD_WEBHOOK_PARAMETER = "/servers/discord-webhook-url"
+
+SAMPLE_SECONDS = 60
+# Memory must be over a threshold for this many samples in a row
+SUSTAINED_SAMPLES = 5
+# Fraction of total memory the game may hold resident
+RSS_LIMIT = 0.85
+SWAP_LIMIT_BYTES = 256 * 1024**2
+# Share of time some tasks stall on memory (PSI "some avg60"), percent
+PRESSURE_LIMIT = 10.0
+RESTART_COOLDOWN_SECONDS = 6 * 3600
+
+# Process command line match, Steam query port and restart command per game
+GAMES = {
+    "moria": {
+        "process": "MoriaServer",
+        "query_port": 7777,
+        "restart": ["docker", "compose", "restart"],
+        "cwd": moria_launcher.COMPOSE_DIR,
+    },
+    "valheim": {
+        "process": "valheim_server",
+        "query_port": 2457,
+        "restart": ["systemctl", "restart", "valheim.service"],
+        "cwd": None,
+    },
+}
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+A2S_HEADER = b"\xff\xff\xff\xff"
+A2S_INFO = A2S_HEADER + b"TSource Engine Query\x00"
+
+
+def find_process(name: str) -> int | None:
+    """Largest resident process whose command line contains `name`."""
+    best, best_rss = None, -1
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as fp:
+                if name.encode() not in fp.read():
+                    continue
+            with open(f"/proc/{pid}/statm") as fp:
+                rss = int(fp.read().split()[1])
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+        if rss > best_rss:
+            best, best_rss = int(pid), rss
+    return best
+
+
+def read_meminfo() -> dict[str, int]:
+    meminfo = {}
+    with open("/proc/meminfo") as fp:
+        for line in fp:
+            key, value = line.split(":", 1)
+            meminfo[key] = int(value.split()[0]) * 1024
+    return meminfo
+
+
+def read_pressure() -> float | None:
+    """PSI memory "some avg60", or None on kernels without PSI."""
+    try:
+        with open("/proc/pressure/memory") as fp:
+            for line in fp:
+                if line.startswith("some"):
+                    fields = dict(field.split("=") for field in line.split()[1:])
+                    return float(fields["avg60"])
+    except (FileNotFoundError, OSError):
+        pass
+    return None
+
+
+def read_process(pid: int) -> dict:
+    """Cumulative CPU seconds, major faults and memory of a process."""
+    with open(f"/proc/{pid}/stat") as fp:
+        # Fields after the parenthesised command name, which may contain spaces
+        fields = fp.read().rsplit(")", 1)[1].split()
+    status = {}
+    with open(f"/proc/{pid}/status") as fp:
+        for line in fp:
+            if line.startswith(("VmRSS:", "VmSwap:")):
+                key, value = line.split(":", 1)
+                status[key] = int(value.split()[0]) * 1024
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "major_faults": int(fields[9]),
+        "rss_bytes": status.get("VmRSS", 0),
+        "swap_bytes": status.get("VmSwap", 0),
+    }
+
+
+def query_players(port: int, timeout: float = 1.0) -> int | None:
+    """Player count from A2S_INFO on the local query port, or None if the
+    server does not answer."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        request = A2S_INFO
+        try:
+            for _ in range(2):
+                sock.sendto(request, ("127.0.0.1", port))
+                data = sock.recv(1400)
+                if data[4:5] == b"A":
+                    request = A2S_INFO + data[5:9]
+                    continue
+                offset = 6  # Header, type and protocol
+                for _ in range(4):  # Name, map, folder, game
+                    offset = data.index(b"\x00", offset) + 1
+                return struct.unpack_from("<B", data, offset + 2)[0]
+        except (OSError, ValueError, struct.error) as ex:
+            logger.debug("No A2S answer on port %s: %s", port, ex)
+    return None
+
+
+class Watchdog:
+    def __init__(self, game: str, publish: bool = True):
+        self.game = game
+        self.config = GAMES[game]
+        self.publish = publish
+        self.cloudwatch = boto3.client("cloudwatch") if publish else None
+        self.players = None
+        self.previous = None
+        self.over_limit = 0
+        self.restart_planned = None
+        self.last_restart = None
+
+    def sample(self) -> dict | None:
+        pid = find_process(self.config["process"])
+        if pid is None:
+            self.previous = None
+            return None
+        now = time.monotonic()
+        process = read_process(pid)
+        meminfo = read_meminfo()
+        sample = {
+            "pid": pid,
+            "rss_bytes": process["rss_bytes"],
+            "swap_bytes": process["swap_bytes"],
+            "rss_fraction": process["rss_bytes"] / meminfo["MemTotal"],
+            "available_bytes": meminfo["MemAvailable"],
+            "pressure": read_pressure(),
+            "cpu_percent": None,
+            "major_faults_per_s": None,
+        }
+        previous = self.previous
+        if previous and previous["pid"] == pid:
+            elapsed = now - previous["time"]
+            sample["cpu_percent"] = (
+                100 * (process["cpu_seconds"] - previous["cpu_seconds"]) / elapsed
+            )
+            sample["major_faults_per_s"] = (
+                process["major_faults"] - previous["major_faults"]
+            ) / elapsed
+        self.previous = {"pid": pid, "time": now, **process}
+        return sample
+
+    def over_limits(self, sample: dict) -> list[str]:
+        reasons = []
+        if sample["rss_fraction"] > RSS_LIMIT:
+            reasons.append(f"resident memory at {sample['rss_fraction']:.0%}")
+        if sample["swap_bytes"] > SWAP_LIMIT_BYTES:
+            reasons.append(f"{sample['swap_bytes'] / 1024**2:.0f} MB swapped")
+        if sample["pressure"] is not None and sample["pressure"] > PRESSURE_LIMIT:
+            reasons.append(f"memory pressure {sample['pressure']:.1f}%")
+        return reasons
+
+    def publish_sample(self, sample: dict):
+        units = {
+            "rss_bytes": ("ResidentMemory", "Bytes"),
+            "swap_bytes": ("SwappedMemory", "Bytes"),
+            "available_bytes": ("AvailableMemory", "Bytes"),
+            "pressure": ("MemoryPressure", "Percent"),
+            "cpu_percent": ("ProcessCPU", "Percent"),
+            "major_faults_per_s": ("MajorFaults", "Count/Second"),
+            "players": ("Players", "Count"),
+        }
+        metric_data = [
+            {
+                "MetricName": name,
+                "Dimensions": [{"Name": "Server", "Value": self.game}],
+                "Value": sample[key],
+                "Unit": unit,
+            }
+            for key, (name, unit) in units.items()
+            if sample.get(key) is not None
+        ]
+        try:
+            self.cloudwatch.put_metric_data(
+                Namespace=METRIC_NAMESPACE, MetricData=metric_data
+            )
+        except Exception as ex:
+            logger.error("Could not publish metrics: %s", ex)
+
+    def track_players(self, players: int | None):
+        """Record a session event when the player count changes."""
+        if players is None or players == self.players:
+            return
+        first, self.players = self.players is None, players
+        if first and not players:
+            return
+        sessions.record(self.game, "active" if players else "idle", players=players)
+
+    def announce(self, message: str):
+        try:
+            webhook_url = boto3.client("ssm").get_parameter(
+                Name=DISCORD_WEBHOOK_PARAMETER, WithDecryption=True
+            )["Parameter"]["Value"]
+            request = urllib.request.Request(
+                webhook_url,
+                data=json.dumps({"content": message}).encode(),
+                headers={"Content-Type": "application/json"},
+            )
+            urllib.request.urlopen(request, timeout=10).close()
+        except Exception as ex:
+            logger.error("Could not announce to Discord: %s", ex)
+
+    def restart(self, reasons: list[str]):
+        self.announce(
+            f"{self.game.capitalize()} server is empty and restarting to free "
+            f"memory ({', '.join(reasons)})"
+        )
+        logger.info("Restarting %s: %s", self.game, ", ".join(reasons))
+        subprocess.run(self.config["restart"], cwd=self.config["cwd"], check=False)
+        self.last_restart = time.monotonic()
+        self.restart_planned = None
+        self.over_limit = 0
+        self.previous = None
+
+    def check(self):
+        sample = self.sample()
+        if sample is None:
+            return
+        sample["players"] = query_players(self.config["query_port"])
+        self.track_players(sample["players"])
+        if self.publish:
+            self.publish_sample(sample)
+
+        reasons = self.over_limits(sample)
+        if not reasons:
+            self.over_limit = 0
+            self.restart_planned = None
+            return
+        self.over_limit += 1
+        if self.over_limit >= SUSTAINED_SAMPLES and self.restart_planned is None:
+            cooled_down = (
+                self.last_restart is None
+                or time.monotonic() - self.last_restart > RESTART_COOLDOWN_SECONDS
+            )
+            if cooled_down:
+                logger.info("Planning restart: %s", ", ".join(reasons))
+                self.restart_planned = reasons
+
+        if self.restart_planned:
+            if sample["players"] == 0:
+                self.restart(self.restart_planned)
+            else:
+                logger.info(
+                    "Restart waiting for %s players to leave", sample["players"]
+                )
+
+    def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Watchdog check failed")
+            time.sleep(max(0, SAMPLE_SECONDS - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--game", required=True, choices=sorted(GAMES))
+    parser.add_argument(
+        "--no-metrics", action="store_true", help="Do not publish to CloudWatch"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    Watchdog(args.game, publish=not args.no_metrics).run()
@@ -0,0 +1,22 @@
+import os
+import sys
+
+
+# Module-level boto3 clients need a region, no calls reach AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+
+# Lambda handlers import the layer modules by name, as they do in the runtime
+for path in (
+    os.path.join(ROOT, "lambda", "shared"),
+    os.path.join(ROOT, "lambda", "functions", "backup"),
+    os.path.join(ROOT, "lambda", "functions", "discord"),
+    os.path.join(ROOT, "lambda", "functions", "start"),
+    os.path.join(ROOT, "lambda", "functions", "startmsg"),
+    os.path.join(ROOT, "lambda", "functions", "status"),
+    os.path.join(ROOT, "lambda", "functions", "stop"),
+    os.path.join(ROOT, "server"),
+    os.path.join(ROOT, "tools"),
+):
+    sys.path.insert(0, os.path.abspath(path))
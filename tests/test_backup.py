@@ -0,0 +1,159 @@
+import pytest
+
+import backup
+import sessions
+
+
+class FakeEC2:
+    def __init__(self, running: list[str] = ()):
+        self.running = list(running)
+
+    def describe_instances(self, InstanceIds=None, Filters=None):
+        if Filters is not None:
+            return {
+                "Reservations": [
+                    {"Instances": [{"InstanceId": instance_id}]}
+                    for instance_id in self.running
+                ]
+            }
+        tags = {"i-1": "valheim", "i-2": "servers"}
+        return {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {
+                            "InstanceId": instance_id,
+                            "Tags": [{"Key": "project", "Value": tags[instance_id]}],
+                        }
+                        for instance_id in InstanceIds
+                    ]
+                }
+            ]
+        }
+
+
+def state_change(instance_id: str, state: str) -> dict:
+    return {
+        "source": "aws.ec2",
+        "time": "2026-09-07T18:00:05Z",
+        "detail": {"instance-id": instance_id, "state": state},
+    }
+
+
+def test_state_changes_are_recorded(monkeypatch, tmp_path):
+    store = sessions.FileStore(str(tmp_path / "sessions.jsonl"))
+    monkeypatch.setattr(sessions, "_store", store)
+    monkeypatch.setattr(backup, "ec2", FakeEC2())
+
+    backup.record_session(state_change("i-1", "running"))
+    backup.record_session(state_change("i-1", "stopped"))
+    backup.record_session(state_change("i-2", "running"))
+
+    assert list(store.scan()) == [
+        {
+            "server": "valheim",
+            "at": 1788804005000,
+            "event": event,
+            "instance_id": "i-1",
+        }
+        for event in ("start", "stop")
+    ]
+
+
+class FakeBackup:
+    def __init__(self, *states: str):
+        self.jobs = [
+            {"BackupJobId": f"job-{index}", "State": state}
+            for index, state in enumerate(states)
+        ]
+        self.started = []
+
+    def list_backup_jobs(self, ByResourceArn, ByCreatedAfter):
+        assert ByResourceArn == "arn:efs"
+        return {"BackupJobs": self.jobs}
+
+    def start_backup_job(self, **kwargs):
+        self.started.append(kwargs)
+        return {"BackupJobId": f"job-{len(self.jobs)}"}
+
+
+class FakeEvents:
+    def __init__(self):
+        self.calls = []
+
+    def enable_rule(self, Name):
+        self.calls.append(("enable", Name))
+
+    def disable_rule(self, Name):
+        self.calls.append(("disable", Name))
+
+
+@pytest.fixture
+def clients(monkeypatch, tmp_path):
+    for name, value in {
+        "BACKUP_RESOURCE_ARN": "arn:efs",
+        "BACKUP_VAULT_NAME": "vault",
+        "BACKUP_ROLE_ARN": "arn:role",
+        "BACKUP_SCHEDULE_RULE_NAME": "servers-backup-schedule",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(
+        sessions, "_store", sessions.FileStore(str(tmp_path / "sessions.jsonl"))
+    )
+
+    def install(*states: str, running: list[str] = ()):
+        fakes = FakeBackup(*states), FakeEvents()
+        monkeypatch.setattr(backup, "aws_backup", fakes[0])
+        monkeypatch.setattr(backup, "events", fakes[1])
+        monkeypatch.setattr(backup, "ec2", FakeEC2(running))
+        return fakes
+
+    return install
+
+
+def test_capped_backup_skips_after_a_completed_job(clients):
+    aws_backup, _ = clients("COMPLETED")
+
+    assert not backup.start_backup("world save", capped=True)
+    assert aws_backup.started == []
+
+
+def test_stop_backup_only_skips_an_active_job(clients):
+    aws_backup, _ = clients("COMPLETED", "FAILED")
+
+    assert backup.start_backup("server stop", capped=False)
+    assert aws_backup.started[0]["BackupVaultName"] == "vault"
+    assert aws_backup.started[0]["ResourceArn"] == "arn:efs"
+
+    aws_backup, _ = clients("COMPLETED", "RUNNING")
+
+    assert not backup.start_backup("server stop", capped=False)
+    assert aws_backup.started == []
+
+
+def test_last_server_stop_backs_up_and_disables_the_schedule(clients):
+    aws_backup, events = clients("COMPLETED")
+
+    backup.handler(state_change("i-1", "stopped"), None)
+
+    assert len(aws_backup.started) == 1
+    assert events.calls == [("disable", "servers-backup-schedule")]
+
+
+def test_schedule_stays_enabled_while_a_server_runs(clients):
+    aws_backup, events = clients(running=["i-3"])
+
+    backup.handler(state_change("i-1", "stopped"), None)
+    backup.handler(state_change("i-1", "running"), None)
+
+    assert len(aws_backup.started) == 1
+    assert events.calls == [("enable", "servers-backup-schedule")]
+
+
+def test_scheduled_backup_disables_the_schedule_once_servers_stop(clients):
+    aws_backup, events = clients()
+
+    backup.handler({"source": "aws.events"}, None)
+
+    assert aws_backup.started == []
+    assert events.calls == [("disable", "servers-backup-schedule")]
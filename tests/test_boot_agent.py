@@ -0,0 +1,79 @@
+import boot_agent
+from boot_agent import Step, StepSkipped
+
+
+def test_run_steps_passes_values_to_dependent_steps():
+    received = {}
+
+    def start_game():
+        return (5, 100)
+
+    def game_ready(**values):
+        received.update(values)
+
+    def mount():
+        raise StepSkipped("already mounted")
+
+    results = boot_agent.run_steps(
+        [
+            Step("mount", mount),
+            Step("start_game", start_game, requires=("mount",)),
+            Step("game_ready", game_ready, requires=("mount", "start_game")),
+        ]
+    )
+
+    assert [result["status"] for result in results] == ["skipped", "ok", "ok"]
+    assert received == {"start_game": (5, 100)}
+
+
+def test_run_steps_skips_steps_after_a_failure():
+    ran = []
+
+    def fail():
+        raise RuntimeError("mount failed")
+
+    results = boot_agent.run_steps(
+        [
+            Step("mount", fail),
+            Step("start_game", lambda: ran.append("start_game"), requires=("mount",)),
+            Step("update_game", lambda: ran.append("update_game")),
+        ]
+    )
+
+    assert results[0]["detail"] == "mount failed"
+    assert results[1] == {
+        "step": "start_game",
+        "status": "failed",
+        "seconds": 0,
+        "detail": "requires mount",
+    }
+    assert ran == ["update_game"]
+
+
+def test_run_steps_starts_after_a_failed_soft_requirement():
+    ran = []
+
+    def fail():
+        raise RuntimeError("steamcmd exited 8")
+
+    results = boot_agent.run_steps(
+        [
+            Step("mount", lambda: ran.append("mount")),
+            Step("update_game", fail),
+            Step(
+                "start_game",
+                lambda: ran.append("start_game"),
+                requires=("mount",),
+                after=("update_game",),
+            ),
+        ]
+    )
+
+    assert [result["status"] for result in results] == ["ok", "failed", "ok"]
+    assert ran == ["mount", "start_game"]
+
+
+def test_valheim_starts_after_a_failed_update():
+    steps = {step.name: step for step in boot_agent.GAME_STEPS["valheim"]}
+    assert "update_game" not in steps["start_game"].requires
+    assert "update_game" in steps["start_game"].after
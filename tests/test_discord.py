@@ -0,0 +1,174 @@
+import base64
+import json
+
+import pytest
+from nacl.signing import SigningKey
+
+import discord
+
+
+VALHEIM_APP_ID = "1370896965881299065"
+TIMESTAMP = "1760000000"
+
+
+class FakeLambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        assert InvocationType == "Event"
+        self.invocations.append((FunctionName, json.loads(Payload)))
+
+
+@pytest.fixture
+def signing_key(monkeypatch):
+    key = SigningKey.generate()
+    monkeypatch.setattr(
+        discord, "PUBLIC_KEYS", {"/valheim": key.verify_key.encode().hex()}
+    )
+    return key
+
+
+@pytest.fixture
+def fake_lambda(monkeypatch):
+    fake = FakeLambda()
+    monkeypatch.setattr(discord, "aws_lambda", fake)
+    return fake
+
+
+def interaction(action: str, group: str | None = None) -> str:
+    options = [{"name": "action", "type": 3, "value": action}]
+    if group:
+        options.append({"name": "group", "type": 3, "value": group})
+    return json.dumps(
+        {
+            "type": 2,
+            "application_id": VALHEIM_APP_ID,
+            "token": "interaction-token",
+            "data": {"name": "valheim", "options": options},
+            "member": {"user": {"username": "viking"}},
+        }
+    )
+
+
+def signed_headers(key: SigningKey, body: str) -> dict:
+    signature = key.sign((TIMESTAMP + body).encode()).signature.hex()
+    return {
+        "Content-Type": "application/json",
+        "X-Signature-Ed25519": signature,
+        "X-Signature-Timestamp": TIMESTAMP,
+    }
+
+
+def rest_event(path: str, headers: dict, body: str) -> dict:
+    """API Gateway REST proxy event, payload format 1.0."""
+    return {
+        "httpMethod": "POST",
+        "path": path,
+        "headers": headers,
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def url_event(path: str, headers: dict, body: str, base64_body=False) -> dict:
+    """Lambda function URL event, payload format 2.0, with lowercase headers."""
+    if base64_body:
+        body = base64.b64encode(body.encode()).decode()
+    return {
+        "version": "2.0",
+        "rawPath": path,
+        "requestContext": {"http": {"method": "POST"}},
+        "headers": {name.lower(): value for name, value in headers.items()},
+        "body": body,
+        "isBase64Encoded": base64_body,
+    }
+
+
+def test_rest_event_is_accepted(signing_key, fake_lambda):
+    body = interaction("start")
+    resp = discord.handler(
+        rest_event("/valheim", signed_headers(signing_key, body), body), None
+    )
+
+    assert resp["statusCode"] == 200
+    assert json.loads(resp["body"]) == {"type": 5}
+    assert fake_lambda.invocations == [
+        (
+            "servers-start",
+            {
+                "application_id": VALHEIM_APP_ID,
+                "application_name": "Valheim",
+                "instance_ids": [discord.SERVER_INSTANCES[VALHEIM_APP_ID]],
+                "instance_names": {discord.SERVER_INSTANCES[VALHEIM_APP_ID]: "Valheim"},
+                "token": "interaction-token",
+                "requester": "viking",
+            },
+        )
+    ]
+
+
+@pytest.mark.parametrize("base64_body", [False, True])
+def test_function_url_event_is_accepted(signing_key, fake_lambda, base64_body):
+    body = interaction("status")
+    event = url_event(
+        "/valheim", signed_headers(signing_key, body), body, base64_body=base64_body
+    )
+
+    resp = discord.handler(event, None)
+
+    assert resp["statusCode"] == 200
+    assert [name for name, _ in fake_lambda.invocations] == ["servers-status"]
+
+
+def test_ping_is_answered(signing_key, fake_lambda):
+    body = json.dumps({"type": 1})
+    resp = discord.handler(
+        url_event("/valheim/", signed_headers(signing_key, body), body), None
+    )
+
+    assert json.loads(resp["body"]) == {"type": 1}
+    assert fake_lambda.invocations == []
+
+
+def test_bad_signature_is_rejected(signing_key, fake_lambda):
+    body = interaction("start")
+    headers = signed_headers(SigningKey.generate(), body)
+
+    resp = discord.handler(rest_event("/valheim", headers, body), None)
+
+    assert resp["statusCode"] == 401
+    assert fake_lambda.invocations == []
+
+
+def test_missing_signature_is_rejected(signing_key, fake_lambda):
+    body = interaction("start")
+    resp = discord.handler(rest_event("/valheim", {}, body), None)
+
+    assert resp["statusCode"] == 401
+
+
+def test_unknown_path_is_not_found(signing_key, fake_lambda):
+    body = interaction("start")
+    resp = discord.handler(
+        url_event("/minecraft", signed_headers(signing_key, body), body), None
+    )
+
+    assert resp["statusCode"] == 404
+    assert fake_lambda.invocations == []
+
+
+def test_group_payload_is_sent_to_start(signing_key, fake_lambda):
+    body = interaction("start", group="all")
+    discord.handler(
+        url_event("/valheim", signed_headers(signing_key, body), body), None
+    )
+
+    ((name, payload),) = fake_lambda.invocations
+    assert name == "servers-start"
+    assert payload["instance_ids"] == discord.SERVER_GROUPS["all"]
+    assert payload["instance_names"] == {
+        discord.SERVER_INSTANCES["1442796677156175966"]: "Moria",
+        discord.SERVER_INSTANCES[VALHEIM_APP_ID]: "Valheim",
+    }
+    assert payload["application_name"] == "Valheim"
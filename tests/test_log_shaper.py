@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+import log_shaper
+from log_shaper import LogShaper
+
+
+def shaper(**kwargs):
+    shipped = []
+    kwargs.setdefault("window_seconds", 60)
+    shaper = LogShaper(
+        log_shaper.PASS_THROUGH["valheim"],
+        log_shaper.NOISE["valheim"],
+        shipped.append,
+        **kwargs,
+    )
+    return shaper, shipped
+
+
+def test_lifecycle_lines_always_pass_through():
+    shaper_, shipped = shaper()
+    for _ in range(3):
+        shaper_.feed("10/19/2026 12:00:01: World saved ( 12.3ms )\n")
+
+    assert shipped == ["10/19/2026 12:00:01: World saved ( 12.3ms )"] * 3
+
+
+def test_noise_is_dropped_and_counted():
+    shaper_, shipped = shaper()
+    shaper_.feed("(Filename: ./Runtime/Export/Debug.cs Line: 35)\n")
+    shaper_.feed("\n")
+    shaper_.flush()
+    assert shipped == []
+
+    shaper_.flush(force=True)
+    assert shipped == ["[dropped 2 noise lines]"]
+    assert shaper_.dropped == 0
+
+
+def test_repeats_are_summarized_when_the_window_ends():
+    shaper_, shipped = shaper()
+    shaper_.feed("10/19/2026 12:00:01: Spawned 3 trolls\n")
+    shaper_.feed("10/19/2026 12:00:02: Spawned 4 trolls\n")
+    shaper_.feed("10/19/2026 12:00:03: Spawned 5 trolls\n")
+    shaper_.feed("10/19/2026 12:00:04: Something else\n")
+    assert shipped == [
+        "10/19/2026 12:00:01: Spawned 3 trolls",
+        "10/19/2026 12:00:04: Something else",
+    ]
+
+    shaper_.flush(force=True)
+    assert shipped[2:] == ["[repeated 2x] 10/19/2026 12:00:01: Spawned 3 trolls"]
+
+    # A new window ships the line again
+    shaper_.feed("10/19/2026 12:01:01: Spawned 6 trolls\n")
+    assert shipped[-1] == "10/19/2026 12:01:01: Spawned 6 trolls"
+
+
+def test_oldest_line_is_summarized_when_over_max_keys():
+    shaper_, shipped = shaper(max_keys=2)
+    shaper_.feed("alpha\n")
+    shaper_.feed("alpha\n")
+    shaper_.feed("beta\n")
+    shaper_.feed("gamma\n")
+
+    assert shipped == ["alpha", "beta", "gamma", "[repeated 1x] alpha"]
+    assert list(shaper_.window) == ["beta", "gamma"]
+
+    # Evicted, so shipped again
+    shaper_.feed("alpha\n")
+    assert shipped[-1] == "alpha"
+
+
+class Stop(Exception):
+    pass
+
+
+def test_follow_reads_appends_rotation_and_truncation(tmp_path, monkeypatch):
+    path = tmp_path / "valheim.log"
+    path.write_text("Load world: old\n")
+    # Written before the shaper started, so skipped
+    os.utime(path, (0, 0))
+
+    def append():
+        with open(path, "a") as fp:
+            fp.write("Game server connected\n")
+
+    def rotate():
+        os.rename(path, tmp_path / "valheim.log.1")
+        path.write_text("World saved\n")
+
+    def truncate():
+        path.write_text("Load world\n")
+
+    def stop():
+        raise Stop
+
+    actions = iter([append, rotate, truncate, stop])
+    monkeypatch.setattr(log_shaper.time, "sleep", lambda seconds: next(actions)())
+    shaper_, shipped = shaper()
+
+    with pytest.raises(Stop):
+        log_shaper.follow(str(path), shaper_)
+
+    assert shipped == ["Game server connected", "World saved", "Load world"]
@@ -0,0 +1,61 @@
+import moria_launcher
+
+
+def fake_launcher(monkeypatch, mounted: bool, running: list[str]):
+    """Record the launcher's commands and mounts in order."""
+    calls = []
+    state = {"mounted": mounted}
+
+    def run(command, **kwargs):
+        calls.append(command)
+        if command[:2] == ["docker", "ps"] and "--quiet" in command:
+            return "\n".join(running)
+        if command[:2] == ["docker", "ps"]:
+            return moria_launcher.COMPOSE_DIR if running else ""
+        return ""
+
+    def mount_saves(source):
+        calls.append(["mount", source])
+        state["mounted"] = True
+
+    monkeypatch.setattr(moria_launcher, "run", run)
+    monkeypatch.setattr(moria_launcher, "efs_save_dir", lambda: "/mnt/efs/saves")
+    monkeypatch.setattr(moria_launcher, "install_project", lambda: None)
+    monkeypatch.setattr(moria_launcher, "saves_mounted", lambda: state["mounted"])
+    monkeypatch.setattr(moria_launcher, "mount_saves", mount_saves)
+    monkeypatch.setattr(moria_launcher, "log_mark", lambda compose_dir: None)
+    return calls
+
+
+def test_container_started_at_boot_is_stopped_before_mounting(monkeypatch):
+    calls = fake_launcher(monkeypatch, mounted=False, running=["abc123"])
+
+    moria_launcher.launch()
+
+    commands = [call for call in calls if call[:2] != ["docker", "ps"]]
+    assert commands == [
+        ["docker", "stop", "abc123"],
+        ["mount", "/mnt/efs/saves"],
+        ["docker", "compose", "up", "-d", "--no-recreate"],
+    ]
+
+
+def test_running_container_with_saves_mounted_is_kept(monkeypatch):
+    calls = fake_launcher(monkeypatch, mounted=True, running=["abc123"])
+
+    moria_launcher.launch()
+
+    commands = [call for call in calls if call[:2] != ["docker", "ps"]]
+    assert commands == [["docker", "compose", "up", "-d", "--no-recreate"]]
+
+
+def test_saves_are_mounted_before_first_start(monkeypatch):
+    calls = fake_launcher(monkeypatch, mounted=False, running=[])
+
+    moria_launcher.launch()
+
+    commands = [call for call in calls if call[:2] != ["docker", "ps"]]
+    assert commands == [
+        ["mount", "/mnt/efs/saves"],
+        ["docker", "compose", "up", "-d", "--no-recreate"],
+    ]
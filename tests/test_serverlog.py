@@ -0,0 +1,61 @@
+import io
+import json
+import logging
+
+import serverlog
+
+
+def test_redact_copies_only_redacted_containers():
+    clean = {"id": "1", "user": {"username": "viking"}}
+    payload = {
+        "token": "secret",
+        "member": clean,
+        "headers": [{"Authorization": "Bot x"}, {"accept": "*/*"}],
+    }
+
+    redacted = serverlog.redact(payload)
+
+    assert redacted == {
+        "token": serverlog.REDACTED,
+        "member": clean,
+        "headers": [{"Authorization": serverlog.REDACTED}, {"accept": "*/*"}],
+    }
+    assert redacted["member"] is clean
+    assert redacted["headers"][1] is payload["headers"][1]
+    assert payload["token"] == "secret"
+    assert serverlog.redact(clean) is clean
+
+
+def test_sampling_is_decided_per_invocation(monkeypatch):
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(serverlog.JsonFormatter())
+    base = logging.getLogger("test_serverlog")
+    base.addHandler(handler)
+    base.propagate = False
+    base.setLevel(logging.INFO)
+    logger = serverlog.StructuredLogger(
+        base, {"event_received": 0.5, "discord_response": 0.5}
+    )
+
+    @serverlog.invocation
+    def lambda_handler(event, context):
+        logger.info("Received event", event="event_received", payload=event)
+        logger.info("Discord response", event="discord_response", body="{}")
+        logger.info("Always kept", event="other")
+
+    draws = iter([0.2, 0.7])
+    monkeypatch.setattr(serverlog.random, "random", lambda: next(draws))
+    lambda_handler({"token": "secret"}, None)
+    lambda_handler({"token": "secret"}, None)
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["message"] for record in records] == [
+        "Received event",
+        "Discord response",
+        "Always kept",
+        "Always kept",
+    ]
+    assert records[0]["payload"] == {"token": serverlog.REDACTED}
+    assert records[0]["sample_rate"] == 0.5
+    assert "sample_rate" not in records[2]
@@ -0,0 +1,113 @@
+import datetime
+
+import pytest
+
+import sessions
+import sessions_report
+
+
+HOUR = 3600 * 1000
+# Monday 2026-09-07 00:00 UTC
+T0 = int(datetime.datetime(2026, 9, 7, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return sessions.FileStore(str(tmp_path / "sessions.jsonl"))
+
+
+def append(store, server: str, event: str, at: int, **fields):
+    store.append(sessions.make_event(server, event, at=at, **fields))
+
+
+def test_build_sessions(store):
+    # Requested from Discord, two players for an hour
+    append(store, "valheim", "request", T0, action="start", requester="viking")
+    append(store, "valheim", "start", T0 + 20_000, instance_id="i-1")
+    append(store, "valheim", "ready", T0 + 200_000)
+    append(store, "valheim", "active", T0 + HOUR // 2, players=2)
+    append(store, "valheim", "idle", T0 + 3 * HOUR // 2, players=0)
+    append(store, "valheim", "request", T0 + 2 * HOUR, action="stop", requester="x")
+    append(store, "valheim", "stop", T0 + 2 * HOUR + 20_000, instance_id="i-1")
+    # Started from the console an hour after a start request that failed, and
+    # its stop was lost
+    append(store, "valheim", "request", T0 + 3 * HOUR, action="start", requester="x")
+    append(store, "valheim", "start", T0 + 4 * HOUR)
+    append(store, "valheim", "start", T0 + 6 * HOUR)
+    # A stop without a start, then a session still open
+    append(store, "moria", "stop", T0)
+    append(store, "moria", "active", T0 + HOUR, players=1)
+
+    result = sessions_report.build_sessions(store.scan(), now=T0 + 8 * HOUR)
+
+    valheim = [session for session in result if session.server == "valheim"]
+    assert [(s.started, s.ended, s.requester) for s in valheim] == [
+        (T0 + 20_000, T0 + 2 * HOUR + 20_000, "viking"),
+        (T0 + 4 * HOUR, T0 + 6 * HOUR, None),
+        (T0 + 6 * HOUR, T0 + 8 * HOUR, None),
+    ]
+    assert valheim[0].ready == T0 + 200_000
+    assert (valheim[0].active_ms, valheim[0].player_ms) == (HOUR, 2 * HOUR)
+
+    (moria,) = [session for session in result if session.server == "moria"]
+    assert (moria.started, moria.ended, moria.from_start) == (
+        T0 + HOUR,
+        T0 + 8 * HOUR,
+        False,
+    )
+    assert moria.player_ms == 7 * HOUR
+
+
+def test_aggregate(store):
+    for day, requester in ((0, "viking"), (1, None), (8, "viking")):
+        start = T0 + day * 24 * HOUR
+        if requester:
+            append(
+                store,
+                "valheim",
+                "request",
+                start - 60_000,
+                action="start",
+                requester=requester,
+            )
+        append(store, "valheim", "start", start)
+        append(store, "valheim", "ready", start + 100_000 * (day + 1))
+        append(store, "valheim", "active", start, players=3)
+        append(store, "valheim", "stop", start + 2 * HOUR)
+    append(store, "moria", "start", T0)
+    append(store, "moria", "stop", T0 + HOUR)
+
+    session_list = sessions_report.build_sessions(store.scan(), now=T0 + 30 * 24 * HOUR)
+
+    assert sessions_report.aggregate(session_list, ["server"]) == [
+        {
+            "server": "moria",
+            "sessions": 1,
+            "uptime_hours": 1.0,
+            "active_hours": 0.0,
+            "player_hours": 0.0,
+            "cost_usd": 0.17,
+        },
+        {
+            "server": "valheim",
+            "sessions": 3,
+            "uptime_hours": 6.0,
+            "active_hours": 6.0,
+            "player_hours": 18.0,
+            "cost_usd": 0.23,
+            "ready_p50_s": 200.0,
+            "ready_p90_s": 900.0,
+            "ready_max_s": 900.0,
+        },
+    ]
+    rows = sessions_report.aggregate(
+        [s for s in session_list if s.server == "valheim"], ["week", "requester"]
+    )
+    assert [
+        (row["week"], row["requester"], row["sessions"], row["uptime_hours"])
+        for row in rows
+    ] == [
+        ("2026-W37", "unknown", 1, 2.0),
+        ("2026-W37", "viking", 1, 2.0),
+        ("2026-W38", "viking", 1, 2.0),
+    ]
@@ -0,0 +1,167 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import start
+import stop
+
+
+MORIA = "i-09d189bb90d2212ac"
+VALHEIM = "i-000a7e7cda25c4842"
+NAMES = {MORIA: "Moria", VALHEIM: "Valheim"}
+
+
+class FakeEC2:
+    """Instances in the given states.  An instance mapped to an error code
+    fails the whole call, as EC2 does."""
+
+    def __init__(self, states: dict[str, str]):
+        self.states = states
+        self.calls = []
+
+    def change(self, instance_ids, key):
+        self.calls.append(list(instance_ids))
+        for instance_id in instance_ids:
+            if self.states[instance_id].startswith("Incorrect"):
+                raise ClientError(
+                    {"Error": {"Code": self.states[instance_id]}}, "ChangeState"
+                )
+        return {
+            key: [
+                {
+                    "InstanceId": instance_id,
+                    "PreviousState": {"Name": self.states[instance_id]},
+                }
+                for instance_id in instance_ids
+            ]
+        }
+
+    def start_instances(self, InstanceIds):
+        return self.change(InstanceIds, "StartingInstances")
+
+    def stop_instances(self, InstanceIds):
+        return self.change(InstanceIds, "StoppingInstances")
+
+
+class FakeQueue:
+    def __init__(self):
+        self.bodies = []
+
+    def send_message(self, QueueUrl, MessageBody):
+        self.bodies.append(json.loads(MessageBody))
+
+
+class Response:
+    status_code = 200
+    text = "{}"
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    sent = []
+    for module in (start, stop):
+        monkeypatch.setattr(
+            module.requests,
+            "patch",
+            lambda url, data: sent.append(data["content"]) or Response(),
+        )
+    return sent
+
+
+def command(instance_ids: list[str]) -> dict:
+    return {
+        "application_id": "1370896965881299065",
+        "application_name": "Valheim",
+        "instance_ids": instance_ids,
+        "instance_names": {
+            instance_id: NAMES[instance_id] for instance_id in instance_ids
+        },
+        "token": "interaction-token",
+        "requester": "viking",
+    }
+
+
+def test_batched_start_falls_back_to_one_call_per_instance(monkeypatch):
+    ec2 = FakeEC2({MORIA: "IncorrectInstanceState", VALHEIM: "stopped"})
+    monkeypatch.setattr(start, "ec2", ec2)
+
+    results = start.start_instances([MORIA, VALHEIM])
+
+    assert ec2.calls == [[MORIA, VALHEIM], [MORIA], [VALHEIM]]
+    assert results == {
+        MORIA: {"error": "IncorrectInstanceState"},
+        VALHEIM: {"previous_state": "stopped"},
+    }
+
+
+def test_group_start_reports_each_server(monkeypatch, replies):
+    ec2 = FakeEC2({MORIA: "IncorrectInstanceState", VALHEIM: "stopped"})
+    queue = FakeQueue()
+    monkeypatch.setattr(start, "ec2", ec2)
+    monkeypatch.setattr(start, "sqs", queue)
+
+    start.handler(command([MORIA, VALHEIM]), None)
+
+    assert replies == [
+        "Moria server failed to start (IncorrectInstanceState)\n"
+        "Valheim server is starting"
+    ]
+    assert [(body["server"], body["followup"]) for body in queue.bodies] == [
+        ("valheim", True)
+    ]
+
+
+def test_group_start_with_a_running_server(monkeypatch, replies):
+    queue = FakeQueue()
+    monkeypatch.setattr(start, "ec2", FakeEC2({MORIA: "running", VALHEIM: "stopped"}))
+    monkeypatch.setattr(start, "sqs", queue)
+
+    start.handler(command([MORIA, VALHEIM]), None)
+
+    assert replies == ["Moria server is already running\nValheim server is starting"]
+    assert [body["server"] for body in queue.bodies] == ["valheim"]
+
+
+def test_single_start_keeps_the_spinner(monkeypatch, replies):
+    queue = FakeQueue()
+    monkeypatch.setattr(start, "ec2", FakeEC2({VALHEIM: "stopped"}))
+    monkeypatch.setattr(start, "sqs", queue)
+
+    start.handler(command([VALHEIM]), None)
+
+    # startmsg replaces the spinner once the server is ready
+    assert replies == []
+    assert queue.bodies == [
+        {
+            "application_id": "1370896965881299065",
+            "application_name": "Valheim",
+            "server": "valheim",
+            "instance_id": VALHEIM,
+            "token": "interaction-token",
+            "followup": False,
+        }
+    ]
+
+
+def test_single_start_of_a_running_server_replies(monkeypatch, replies):
+    queue = FakeQueue()
+    monkeypatch.setattr(start, "ec2", FakeEC2({VALHEIM: "running"}))
+    monkeypatch.setattr(start, "sqs", queue)
+
+    start.handler(command([VALHEIM]), None)
+
+    assert replies == ["Valheim server is already running"]
+    assert queue.bodies == []
+
+
+def test_group_stop_reports_each_server(monkeypatch, replies):
+    ec2 = FakeEC2({MORIA: "running", VALHEIM: "IncorrectInstanceState"})
+    monkeypatch.setattr(stop, "ec2", ec2)
+
+    stop.handler(command([MORIA, VALHEIM]), None)
+
+    assert ec2.calls == [[MORIA, VALHEIM], [MORIA], [VALHEIM]]
+    assert replies == [
+        "Moria server is stopped\nValheim server failed to stop (IncorrectInstanceState)"
+    ]
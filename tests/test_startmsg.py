@@ -0,0 +1,165 @@
+import base64
+import gzip
+import json
+
+import startmsg
+
+
+class FakeQueue:
+    """SQS queue that returns at most `page` visible messages per receive, and
+    nothing for the first `empty_receives` receives, as short polls may."""
+
+    def __init__(self, bodies: list[dict], page: int = 10, empty_receives: int = 0):
+        self.messages = {
+            f"receipt-{index}": json.dumps(body) for index, body in enumerate(bodies)
+        }
+        self.page = page
+        self.empty_receives = empty_receives
+        self.hidden = set()
+        self.released = []
+
+    def receive_message(
+        self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, VisibilityTimeout
+    ):
+        assert WaitTimeSeconds > 0
+        if self.empty_receives:
+            self.empty_receives -= 1
+            return {}
+        visible = [receipt for receipt in self.messages if receipt not in self.hidden]
+        batch = visible[: min(self.page, MaxNumberOfMessages)]
+        self.hidden.update(batch)
+        if not batch:
+            return {}
+        return {
+            "Messages": [
+                {"ReceiptHandle": receipt, "Body": self.messages[receipt]}
+                for receipt in batch
+            ]
+        }
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        del self.messages[ReceiptHandle]
+        self.hidden.discard(ReceiptHandle)
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        assert VisibilityTimeout == 0
+        self.hidden.discard(ReceiptHandle)
+        self.released.append(ReceiptHandle)
+
+
+class Response:
+    status_code = 200
+    text = "{}"
+
+
+def log_event(server: str) -> dict:
+    data = {"logGroup": f"/aws/ec2/{server}", "logEvents": []}
+    encoded = base64.b64encode(gzip.compress(json.dumps(data).encode()))
+    return {"awslogs": {"data": encoded.decode()}}
+
+
+def start_message(server: str, followup: bool = False) -> dict:
+    return {
+        "application_id": "1370896965881299065",
+        "application_name": server.capitalize(),
+        "server": server,
+        "token": f"{server}-token",
+        "followup": followup,
+    }
+
+
+def test_only_the_ready_server_is_announced(monkeypatch):
+    queue = FakeQueue(
+        [start_message("moria", followup=True), start_message("valheim", True)]
+    )
+    posts = []
+    monkeypatch.setattr(startmsg, "sqs", queue)
+    monkeypatch.setattr(
+        startmsg.requests,
+        "post",
+        lambda url, data: posts.append((url, data)) or Response(),
+    )
+
+    startmsg.handler(log_event("valheim"), None)
+
+    assert posts == [
+        (
+            "https://discord.com/api/v10/webhooks/1370896965881299065/valheim-token",
+            {"content": "Valheim server is ready"},
+        )
+    ]
+    assert list(queue.messages) == ["receipt-0"]
+    assert queue.released == ["receipt-0"]
+    assert queue.hidden == set()
+
+
+def test_single_server_replaces_the_original_reply(monkeypatch):
+    queue = FakeQueue([start_message("moria")])
+    patches = []
+    monkeypatch.setattr(startmsg, "sqs", queue)
+    monkeypatch.setattr(
+        startmsg.requests,
+        "patch",
+        lambda url, data: patches.append((url, data)) or Response(),
+    )
+
+    startmsg.handler(log_event("moria"), None)
+
+    assert patches == [
+        (
+            "https://discord.com/api/v10/webhooks/1370896965881299065/moria-token/messages/@original",
+            {"content": "Moria server is ready"},
+        )
+    ]
+    assert queue.messages == {}
+
+
+def test_message_behind_others_and_empty_polls_is_found(monkeypatch):
+    bodies = [start_message("moria", followup=True) for _ in range(3)]
+    queue = FakeQueue(bodies + [start_message("valheim")], page=2, empty_receives=1)
+    patches = []
+    monkeypatch.setattr(startmsg, "sqs", queue)
+    monkeypatch.setattr(startmsg.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(
+        startmsg.requests,
+        "patch",
+        lambda url, data: patches.append((url, data)) or Response(),
+    )
+
+    startmsg.handler(log_event("valheim"), None)
+
+    assert [data for _, data in patches] == [{"content": "Valheim server is ready"}]
+    assert sorted(queue.messages) == ["receipt-0", "receipt-1", "receipt-2"]
+    assert queue.hidden == set()
+
+
+def test_message_held_by_another_invocation_is_found(monkeypatch):
+    queue = FakeQueue([start_message("moria")])
+    # Hidden by the invocation for another server, released while waiting
+    queue.hidden.add("receipt-0")
+    patches = []
+    monkeypatch.setattr(startmsg, "sqs", queue)
+    monkeypatch.setattr(startmsg.time, "sleep", lambda seconds: queue.hidden.clear())
+    monkeypatch.setattr(
+        startmsg.requests,
+        "patch",
+        lambda url, data: patches.append((url, data)) or Response(),
+    )
+
+    startmsg.handler(log_event("moria"), None)
+
+    assert [data for _, data in patches] == [{"content": "Moria server is ready"}]
+    assert queue.messages == {}
+
+
+def test_gives_up_when_there_is_no_message(monkeypatch):
+    queue = FakeQueue([start_message("moria")])
+    clock = iter(range(0, 100, 5))
+    monkeypatch.setattr(startmsg, "sqs", queue)
+    monkeypatch.setattr(startmsg.time, "monotonic", lambda: next(clock))
+    monkeypatch.setattr(startmsg.time, "sleep", lambda seconds: None)
+
+    startmsg.handler(log_event("valheim"), None)
+
+    assert list(queue.messages) == ["receipt-0"]
+    assert queue.hidden == set()
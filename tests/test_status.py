@@ -0,0 +1,159 @@
+import asyncio
+import socket
+import struct
+import time
+
+import status
+
+
+CHALLENGE = b"\x01\x02\x03\x04"
+
+
+def info_response(players: int = 2) -> bytes:
+    return (
+        status.A2S_HEADER
+        + b"I\x11"
+        + b"Viking server\x00Dedicated\x00valheim\x00Valheim\x00"
+        + struct.pack("<HBB", 0, players, 10)
+    )
+
+
+def player_response(names: list[str]) -> bytes:
+    body = b"D" + bytes([len(names)])
+    for index, name in enumerate(names):
+        body += bytes([index]) + name.encode() + b"\x00" + struct.pack("<if", 0, 1.0)
+    return status.A2S_HEADER + body
+
+
+class Responder(asyncio.DatagramProtocol):
+    """Fake game server answering A2S queries.
+
+    challenge: demand a challenge before answering
+    delay: seconds before answering A2S_INFO
+    players: whether A2S_PLAYER is answered at all
+    """
+
+    def __init__(self, challenge=False, delay=0.0, players=True):
+        self.challenge = challenge
+        self.delay = delay
+        self.players = players
+        self.requests = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests.append(data)
+        if self.challenge and not data.endswith(CHALLENGE):
+            self.transport.sendto(status.A2S_HEADER + b"A" + CHALLENGE, addr)
+        elif data.startswith(status.A2S_INFO):
+            asyncio.get_running_loop().call_later(
+                self.delay, self.transport.sendto, info_response(), addr
+            )
+        elif self.players:
+            self.transport.sendto(player_response(["Ragnar", "", "Lagertha"]), addr)
+
+
+async def serve(responder: Responder) -> tuple[asyncio.DatagramTransport, int]:
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: responder, local_addr=("127.0.0.1", 0)
+    )
+    return transport, transport.get_extra_info("sockname")[1]
+
+
+def closed_port() -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def run_queries(responders: dict[str, Responder], extra_targets=None):
+    async def main():
+        transports = []
+        targets = dict(extra_targets or {})
+        for key, responder in responders.items():
+            transport, port = await serve(responder)
+            transports.append(transport)
+            targets[key] = ("127.0.0.1", port)
+        started = time.perf_counter()
+        try:
+            results = await status.query_servers(targets)
+        finally:
+            for transport in transports:
+                transport.close()
+        return results, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def test_query_servers():
+    responders = {
+        "challenge": Responder(challenge=True),
+        "direct": Responder(),
+        "slow": Responder(delay=2.0),
+        "info_only": Responder(players=False),
+    }
+    results, elapsed = run_queries(responders, {"closed": ("127.0.0.1", closed_port())})
+
+    for key in ("challenge", "direct"):
+        assert results[key]["name"] == "Viking server"
+        assert results[key]["world"] == "Dedicated"
+        assert (results[key]["players"], results[key]["max_players"]) == (2, 10)
+        assert results[key]["player_names"] == ["Ragnar", "Lagertha"]
+        assert results[key]["latency_ms"] < 1000 * status.QUERY_BUDGET_SECONDS
+    assert responders["challenge"].requests == [
+        status.A2S_INFO,
+        status.A2S_INFO + CHALLENGE,
+        status.A2S_PLAYER + status.A2S_HEADER,
+        status.A2S_PLAYER + CHALLENGE,
+    ]
+    assert results["slow"] is None
+    assert results["closed"] is None
+    # Answered A2S_INFO, so it is up even without player names
+    assert results["info_only"]["players"] == 2
+    assert "player_names" not in results["info_only"]
+    # The slow and silent servers are given up on within the budget
+    assert status.QUERY_BUDGET_SECONDS - 0.05 < elapsed
+    assert elapsed < status.QUERY_BUDGET_SECONDS + 0.1
+
+
+def test_query_servers_without_targets():
+    results, elapsed = run_queries({})
+    assert results == {}
+    assert elapsed < 0.1
+
+
+def server(state: str) -> dict:
+    return {
+        "instance_id": "i-000a7e7cda25c4842",
+        "game": "valheim",
+        "state": state,
+        "public_ip": "203.0.113.10",
+    }
+
+
+def test_format_status():
+    live = {
+        "name": "Viking server",
+        "world": "Dedicated",
+        "players": 2,
+        "max_players": 10,
+        "latency_ms": 41.6,
+        "player_names": ["Ragnar", "Lagertha"],
+    }
+    assert (
+        status.format_status(server("running"), "ok", live)
+        == "Valheim is running (ok), 2/10 players on Dedicated (42 ms): Ragnar, Lagertha"
+    )
+    del live["player_names"]
+    assert (
+        status.format_status(server("running"), None, live)
+        == "Valheim is running, 2/10 players on Dedicated (42 ms)"
+    )
+    assert (
+        status.format_status(server("running"), "initializing", None)
+        == "Valheim is running (initializing), game not responding"
+    )
+    assert status.format_status(server("stopped"), None, None) == "Valheim is stopped"
@@ -0,0 +1,113 @@
+import mmap
+import struct
+
+import pytest
+
+import world_analyzer
+from world_analyzer import WORLD_HEADER, ZDO_HEADER, stable_hash
+
+
+def write_world(path, zdos: list[tuple[str, int, int, int]], version=34, count=None):
+    """Write a world with (prefab, sector x, sector y, data padding) ZDOs."""
+    with open(path, "wb") as fp:
+        fp.write(WORLD_HEADER.pack(version, 1234.5, 42, 1000, count or len(zdos)))
+        for uid, (prefab, sx, sy, padding) in enumerate(zdos):
+            length = world_analyzer.ZDO_MIN_LENGTH + padding
+            fp.write(
+                ZDO_HEADER.pack(
+                    7,
+                    uid,
+                    length,
+                    0,
+                    sx,
+                    sy,
+                    sx * 64.0,
+                    30.0,
+                    sy * 64.0,
+                    stable_hash(prefab),
+                )
+            )
+            fp.write(bytes(padding))
+
+
+def test_counts_prefabs_and_sectors(tmp_path):
+    path = tmp_path / "world.db"
+    write_world(
+        path,
+        [
+            ("Wood", -3, 5, 0),
+            ("Wood", -3, 5, 10),
+            ("Karve", -3, 5, 0),
+            ("Boar", 2, -1, 100),
+            ("Stone", 2, -1, 3),
+        ],
+    )
+
+    scan = world_analyzer.scan_world(str(path), world_analyzer.DROPPED_ITEMS)
+
+    assert (scan["version"], scan["net_time"], scan["zdo_count"]) == (34, 1234.5, 5)
+    assert scan["prefabs"][stable_hash("Wood")] == 2
+    assert scan["prefabs"][stable_hash("Boar")] == 1
+    sectors = {
+        world_analyzer.sector_coords(key): count
+        for key, count in scan["sectors"].items()
+    }
+    assert sectors == {(-3, 5): 3, (2, -1): 2}
+    items = {
+        world_analyzer.sector_coords(key): count
+        for key, count in scan["item_sectors"].items()
+    }
+    assert items == {(-3, 5): 2, (2, -1): 1}
+    ships = {
+        world_analyzer.sector_coords(key): count
+        for key, count in scan["ship_sectors"].items()
+    }
+    assert ships == {(-3, 5): 1}
+
+    summary = world_analyzer.summarize(str(path), scan, top=1)
+    assert summary["hotspots"] == [
+        {
+            "sector": [-3, 5],
+            "position": [-192, 320],
+            "zdos": 3,
+            "dropped_items": 2,
+            "ships": 1,
+        }
+    ]
+
+
+def test_old_world_version_is_refused(tmp_path):
+    path = tmp_path / "world.db"
+    write_world(path, [("Wood", 0, 0, 0)], version=world_analyzer.MIN_WORLD_VERSION - 1)
+
+    with pytest.raises(ValueError, match="old ZDO format"):
+        world_analyzer.scan_world(str(path), [])
+
+
+def test_truncated_table_is_an_error(tmp_path):
+    path = tmp_path / "world.db"
+    write_world(path, [("Wood", 0, 0, 0), ("Stone", 1, 1, 0)], count=3)
+
+    with pytest.raises(ValueError, match="Truncated ZDO table"):
+        world_analyzer.scan_world(str(path), [])
+
+
+def test_reads_across_window_boundaries(tmp_path):
+    path = tmp_path / "world.db"
+    prefabs = ["Wood", "Stone", "Karve", "Boar", "Resin"]
+    # Odd sized ZDOs, so headers straddle every window boundary at some point
+    zdos = [
+        (prefabs[index % len(prefabs)], index % 7 - 3, -(index % 5), index % 97)
+        for index in range(2000)
+    ]
+    write_world(path, zdos)
+    window = 2 * mmap.ALLOCATIONGRANULARITY
+    assert path.stat().st_size > 10 * window
+
+    windowed = world_analyzer.scan_world(str(path), [], window=window)
+    whole = world_analyzer.scan_world(str(path), [])
+
+    assert windowed["zdo_count"] == 2000
+    for key in ("prefabs", "sectors", "item_sectors", "ship_sectors"):
+        assert windowed[key] == whole[key]
+    assert sum(windowed["sectors"].values()) == 2000
@@ -0,0 +1,192 @@
+"""
+Benchmark world save I/O on a mounted filesystem (EFS, EBS, local disk).
+
+Replays the write patterns the game servers use when saving a world and reports
+latency percentiles and throughput for each operation.
+
+Valheim writes `<world>.db.new` and `<world>.fwl.new`, fsyncs them, moves the
+previous files to `.old` and renames the new files into place.  Return to Moria
+rewrites its `.sav` files through a temporary file and replaces the original.
+
+Run it against each mount to compare, e.g.
+
+    python tools/efs_benchmark.py /mnt/efs/benchmark --iterations 20
+    python tools/efs_benchmark.py /home/steam/benchmark --iterations 20
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+
+from stats import percentile
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class Recorder:
+    """Collects per-operation latencies and bytes written."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.bytes = defaultdict(int)
+
+    def time(self, op: str, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.latencies[op].append(time.perf_counter() - started)
+        return result
+
+    def durable_write(self, op: str, path: str, size: int, block: bytes):
+        """Write and fsync a file.  `<op>_write` covers both so its throughput is
+        what reaches the filesystem, `<op>_fsync` is the fsync alone."""
+        started = time.perf_counter()
+        write_file(path, size, block)
+        written = time.perf_counter()
+        fsync_file(path)
+        finished = time.perf_counter()
+        self.latencies[f"{op}_write"].append(finished - started)
+        self.latencies[f"{op}_fsync"].append(finished - written)
+        self.bytes[f"{op}_write"] += size
+
+    def summary(self) -> dict:
+        summary = {}
+        for op, samples in self.latencies.items():
+            total = sum(samples)
+            summary[op] = {
+                "count": len(samples),
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p90_ms": percentile(samples, 90) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+                "max_ms": max(samples) * 1000,
+            }
+            if self.bytes[op]:
+                summary[op]["throughput_mb_s"] = self.bytes[op] / total / 1024**2
+        return summary
+
+
+def write_file(path: str, size: int, block: bytes):
+    """Sequentially write a file of the given size without syncing."""
+    with open(path, "wb") as fp:
+        remaining = size
+        while remaining > 0:
+            fp.write(block[: min(remaining, len(block))])
+            remaining -= len(block)
+        fp.flush()
+
+
+def fsync_file(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def save_valheim(recorder: Recorder, directory: str, db_size: int, fwl_size: int):
+    """One Valheim world save: rewrite .db and .fwl, rotate to .old, rename."""
+    block = os.urandom(CHUNK_SIZE)
+    started = time.perf_counter()
+    for ext, size in (("db", db_size), ("fwl", fwl_size)):
+        path = os.path.join(directory, f"world.{ext}")
+        op = f"valheim_{ext}"
+        recorder.durable_write(op, f"{path}.new", size, block)
+        if os.path.exists(f"{path}.old"):
+            recorder.time(f"{op}_old_remove", os.remove, f"{path}.old")
+        if os.path.exists(path):
+            recorder.time(f"{op}_old_rename", os.rename, path, f"{path}.old")
+        recorder.time(f"{op}_rename", os.rename, f"{path}.new", path)
+    recorder.time("valheim_dir_fsync", fsync_dir, directory)
+    recorder.latencies["valheim_save"].append(time.perf_counter() - started)
+
+
+def save_moria(
+    recorder: Recorder, directory: str, sav_size: int, player_size: int, players: int
+):
+    """One Return to Moria save: replace the world .sav and each player .sav."""
+    block = os.urandom(CHUNK_SIZE)
+    started = time.perf_counter()
+    files = [("World.sav", sav_size)] + [
+        (f"Player{index}.sav", player_size) for index in range(players)
+    ]
+    for name, size in files:
+        path = os.path.join(directory, name)
+        recorder.durable_write("moria_sav", f"{path}.tmp", size, block)
+        recorder.time("moria_sav_replace", os.replace, f"{path}.tmp", path)
+    recorder.time("moria_dir_fsync", fsync_dir, directory)
+    recorder.latencies["moria_save"].append(time.perf_counter() - started)
+
+
+def print_summary(summary: dict):
+    print(
+        f"{'operation':<24}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}"
+        f"{'p99 ms':>10}{'max ms':>10}{'MB/s':>10}"
+    )
+    for op, stats in sorted(summary.items()):
+        throughput = stats.get("throughput_mb_s")
+        print(
+            f"{op:<24}{stats['count']:>7}{stats['p50_ms']:>10.1f}"
+            f"{stats['p90_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+            f"{stats['max_ms']:>10.1f}"
+            f"{'' if throughput is None else f'{throughput:.1f}':>10}"
+        )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="Scratch directory on the mount under test")
+    parser.add_argument("-n", "--iterations", type=int, default=10)
+    parser.add_argument(
+        "-g", "--game", choices=["all", "moria", "valheim"], default="all"
+    )
+    parser.add_argument("--db-mb", type=int, default=100, help="Valheim .db size")
+    parser.add_argument("--fwl-kb", type=int, default=1, help="Valheim .fwl size")
+    parser.add_argument("--sav-mb", type=int, default=20, help="Moria world size")
+    parser.add_argument("--player-kb", type=int, default=64, help="Moria player size")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="Print JSON summary")
+    parser.add_argument(
+        "--interval", type=float, default=0, help="Seconds to wait between saves"
+    )
+    args = parser.parse_args()
+
+    directory = os.path.join(args.path, f"save-benchmark-{os.getpid()}")
+    os.makedirs(directory)
+    recorder = Recorder()
+    try:
+        for iteration in range(args.iterations):
+            if args.game in ("all", "valheim"):
+                save_valheim(
+                    recorder, directory, args.db_mb * 1024**2, args.fwl_kb * 1024
+                )
+            if args.game in ("all", "moria"):
+                save_moria(
+                    recorder,
+                    directory,
+                    args.sav_mb * 1024**2,
+                    args.player_kb * 1024,
+                    args.players,
+                )
+            if args.interval and iteration < args.iterations - 1:
+                time.sleep(args.interval)
+    finally:
+        shutil.rmtree(directory)
+
+    summary = recorder.summary()
+    if args.json:
+        print(json.dumps({"path": args.path, "operations": summary}, indent=2))
+    else:
+        print_summary(summary)
@@ -0,0 +1,77 @@
+"""
+Compare round trip latency of the Discord interaction front doors.
+
+Sends unsigned PING interactions to each endpoint.  The interaction lambda
+rejects them with a 401 after routing and signature verification, so this
+measures the full path through the front door and the lambda without needing a
+Discord signing key.
+
+    python tools/frontdoor_latency.py \\
+        https://{rest api id}.execute-api.us-west-2.amazonaws.com/prod/valheim \\
+        https://{function url id}.lambda-url.us-west-2.on.aws/valheim
+
+Get the URLs from the stack outputs (FlaskAppEndpoint and DiscordFunctionUrl).
+
+"""
+
+import argparse
+import json
+import time
+
+import requests
+
+from stats import percentile
+
+
+PING = json.dumps({"type": 1})
+HEADERS = {
+    "Content-Type": "application/json",
+    "X-Signature-Ed25519": "00" * 64,
+    "X-Signature-Timestamp": "0",
+}
+
+
+def measure(url: str, count: int) -> dict:
+    """Time sequential requests over one keep-alive connection.  The first request
+    includes connection setup and possibly a lambda cold start, so it is reported
+    separately."""
+    session = requests.Session()
+    samples = []
+    statuses = set()
+    for _ in range(count + 1):
+        started = time.perf_counter()
+        resp = session.post(url, data=PING, headers=HEADERS, timeout=10)
+        samples.append((time.perf_counter() - started) * 1000)
+        statuses.add(resp.status_code)
+    first, rest = samples[0], samples[1:]
+    return {
+        "url": url,
+        "statuses": sorted(statuses),
+        "first_ms": first,
+        "p50_ms": percentile(rest, 50),
+        "p90_ms": percentile(rest, 90),
+        "p99_ms": percentile(rest, 99),
+        "max_ms": max(rest),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("urls", nargs="+", help="Interaction endpoint URLs")
+    parser.add_argument("-n", "--requests", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args()
+
+    results = [measure(url, args.requests) for url in args.urls]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(result["url"])
+            print(
+                f"  status {','.join(str(status) for status in result['statuses'])}"
+                f"  first {result['first_ms']:.0f} ms"
+                f"  p50 {result['p50_ms']:.0f} ms  p90 {result['p90_ms']:.0f} ms"
+                f"  p99 {result['p99_ms']:.0f} ms  max {result['max_ms']:.0f} ms"
+            )
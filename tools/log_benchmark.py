@@ -0,0 +1,236 @@
+"""
+Microbenchmark of lambda handler logging.
+
+Replays the log calls of one Discord interaction and the start lambda that
+handles it, with a representative interaction payload and Discord response, in
+three ways:
+
+* eager: the previous f-string logging through the lambda runtime's text format
+* structured: lambda/shared/serverlog.py with its default sampling, decided
+  once per invocation
+* unsampled: serverlog with every record kept, as in a sampled invocation
+
+Reports logging time and log bytes per invocation.  Bytes approximate CloudWatch
+Logs ingest volume.
+
+    python tools/log_benchmark.py
+    python tools/log_benchmark.py --invocations 20000 --json
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), os.pardir, "lambda", "shared")
+)
+import serverlog
+
+
+LAMBDA_FORMAT = "[%(levelname)s]\t%(asctime)s.%(msecs)03dZ\t%(message)s"
+
+INTERACTION = {
+    "app_permissions": "562949953601536",
+    "application_id": "1370896965881299065",
+    "authorizing_integration_owners": {"0": "123456789012345678"},
+    "channel": {
+        "flags": 0,
+        "guild_id": "123456789012345678",
+        "id": "123456789012345679",
+        "last_message_id": "1380000000000000000",
+        "name": "valheim",
+        "nsfw": False,
+        "parent_id": "123456789012345670",
+        "permissions": "2248473465835073",
+        "position": 3,
+        "rate_limit_per_user": 0,
+        "topic": None,
+        "type": 0,
+    },
+    "channel_id": "123456789012345679",
+    "context": 0,
+    "data": {
+        "id": "1370900000000000000",
+        "name": "valheim",
+        "options": [{"name": "action", "type": 3, "value": "start"}],
+        "type": 1,
+    },
+    "entitlements": [],
+    "guild": {"features": [], "id": "123456789012345678", "locale": "en-US"},
+    "guild_id": "123456789012345678",
+    "guild_locale": "en-US",
+    "id": "1380000000000000001",
+    "locale": "en-US",
+    "member": {
+        "avatar": None,
+        "communication_disabled_until": None,
+        "deaf": False,
+        "flags": 0,
+        "joined_at": "2021-02-12T04:05:06.000000+00:00",
+        "mute": False,
+        "nick": None,
+        "pending": False,
+        "permissions": "2248473465835073",
+        "premium_since": None,
+        "roles": ["123456789012345671", "123456789012345672"],
+        "user": {
+            "avatar": "0123456789abcdef0123456789abcdef",
+            "discriminator": "0",
+            "global_name": "Viking",
+            "id": "123456789012345673",
+            "public_flags": 0,
+            "username": "viking",
+        },
+    },
+    "token": "aW50ZXJhY3Rpb246MTM4MDAwMDAwMDAwMDAwMDAwMTp" + "x" * 180,
+    "type": 2,
+    "version": 1,
+}
+
+START_EVENT = {
+    "application_id": INTERACTION["application_id"],
+    "application_name": "Valheim",
+    "instance_ids": ["i-000a7e7cda25c4842"],
+    "instance_names": {"i-000a7e7cda25c4842": "Valheim"},
+    "token": INTERACTION["token"],
+}
+
+DISCORD_RESPONSE = json.dumps(
+    {
+        "application_id": INTERACTION["application_id"],
+        "attachments": [],
+        "author": {
+            "avatar": None,
+            "bot": True,
+            "discriminator": "0000",
+            "id": INTERACTION["application_id"],
+            "username": "Valheim",
+        },
+        "channel_id": INTERACTION["channel_id"],
+        "components": [],
+        "content": "Valheim server is starting",
+        "edited_timestamp": None,
+        "embeds": [],
+        "flags": 0,
+        "id": "1380000000000000002",
+        "interaction_metadata": {
+            "id": INTERACTION["id"],
+            "type": 2,
+            "user": INTERACTION["member"]["user"],
+        },
+        "mention_everyone": False,
+        "mention_roles": [],
+        "mentions": [],
+        "pinned": False,
+        "timestamp": "2025-06-01T18:00:00.000000+00:00",
+        "tts": False,
+        "type": 20,
+        "webhook_id": INTERACTION["application_id"],
+    }
+)
+
+
+class CountingStream:
+    """Write target that only counts bytes."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text: str):
+        self.bytes += len(text.encode("utf-8"))
+
+    def flush(self):
+        pass
+
+
+def eager(logger: logging.Logger):
+    request_json = INTERACTION
+    logger.info(f"Request: {request_json}")
+    interaction_option, group = "start", None
+    logger.info(f"Interaction: {interaction_option} (group: {group})")
+    event = START_EVENT
+    logger.info(f"Received event: {event}")
+    logger.info(f"Discord response ({200}): {json.loads(DISCORD_RESPONSE)}")
+
+
+def structured(logger: serverlog.StructuredLogger):
+    logger.info("Interaction request", event="interaction_request", request=INTERACTION)
+    logger.info(
+        "Interaction",
+        event="interaction",
+        option="start",
+        group=None,
+        application_id=INTERACTION["application_id"],
+    )
+    logger.info("Received event", event="event_received", payload=START_EVENT)
+    logger.info(
+        "Discord response",
+        event="discord_response",
+        status_code=200,
+        body=DISCORD_RESPONSE,
+    )
+
+
+def measure(invocation, logger, stream: CountingStream, count: int) -> dict:
+    for _ in range(min(count, 100)):
+        invocation(logger)
+    stream.bytes = 0
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter_ns()
+        invocation(logger)
+        samples.append(time.perf_counter_ns() - started)
+    samples.sort()
+    return {
+        "p50_us": samples[len(samples) // 2] / 1000,
+        "p99_us": samples[int(len(samples) * 0.99)] / 1000,
+        "mean_us": sum(samples) / len(samples) / 1000,
+        "bytes_per_invocation": stream.bytes / count,
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--invocations", type=int, default=5000)
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args()
+
+    stream = CountingStream()
+    handler = logging.StreamHandler(stream)
+    logging.getLogger().addHandler(handler)
+
+    # The eager logger keeps the runtime's text format on its own handler
+    eager_logger = logging.getLogger("eager")
+    eager_logger.propagate = False
+    eager_handler = logging.StreamHandler(stream)
+    eager_handler.setFormatter(logging.Formatter(LAMBDA_FORMAT))
+    eager_logger.addHandler(eager_handler)
+    eager_logger.setLevel(logging.INFO)
+
+    structured_logger = serverlog.get_logger("structured")
+    unsampled_logger = serverlog.StructuredLogger(logging.getLogger("unsampled"), {})
+
+    results = {
+        "eager": measure(eager, eager_logger, stream, args.invocations),
+        "structured": measure(
+            serverlog.invocation(structured),
+            structured_logger,
+            stream,
+            args.invocations,
+        ),
+        "unsampled": measure(structured, unsampled_logger, stream, args.invocations),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            print(
+                f"{name:>10}: p50 {result['p50_us']:.1f} us  "
+                f"p99 {result['p99_us']:.1f} us  mean {result['mean_us']:.1f} us  "
+                f"{result['bytes_per_invocation']:,.0f} bytes/invocation"
+            )
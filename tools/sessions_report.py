@@ -0,0 +1,232 @@
+"""
+Report server uptime, cost and player time from the session store.
+
+Reads the session events written by the lambdas and the on-instance watchdog
+(see lambda/shared/sessions.py), pieces them into sessions and aggregates the
+sessions by server, ISO week and/or requester.
+
+    python tools/sessions_report.py
+    python tools/sessions_report.py --by server week --since 2026-09-01
+    python tools/sessions_report.py --by requester --store sessions.jsonl --json
+
+A session runs from the instance entering the running state to it entering the
+stopped state.  Its requester is whoever asked Discord to start the server
+within REQUEST_WINDOW_SECONDS before, if anyone.  A session without a stop, if
+an event was lost, ends at the next start, or now if it is still open.  A
+session is counted in the week it started.  Cost is the on-demand price of the
+instance type for the uptime, without storage or data transfer.
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), os.pardir, "lambda", "shared")
+)
+import sessions
+from stats import percentile
+
+
+DEFAULT_TABLE = "servers-sessions"
+# A start request is attributed to a start this soon after it
+REQUEST_WINDOW_SECONDS = 15 * 60
+# On-demand Linux prices in us-west-2, USD per hour
+INSTANCE_PRICES = {
+    "m6a.xlarge": 0.1728,
+    "t3a.medium": 0.0376,
+}
+SERVER_INSTANCE_TYPES = {
+    "moria": "m6a.xlarge",
+    "valheim": "t3a.medium",
+}
+
+
+class Session:
+    def __init__(
+        self, server: str, started: int, requester: str | None, from_start: bool
+    ):
+        self.server = server
+        self.started = started
+        self.requester = requester
+        # Whether the start time is a start event, so time to ready is known
+        self.from_start = from_start
+        self.ended = None
+        self.ready = None
+        self.players = 0
+        self.players_since = started
+        self.active_ms = 0
+        self.player_ms = 0
+
+    def set_players(self, at: int, players: int):
+        elapsed = max(0, at - self.players_since)
+        if self.players:
+            self.active_ms += elapsed
+            self.player_ms += elapsed * self.players
+        self.players = players
+        self.players_since = at
+
+    def end(self, at: int):
+        self.set_players(at, 0)
+        self.ended = at
+
+
+def build_sessions(records, now: int) -> list[Session]:
+    by_server = defaultdict(list)
+    for record in records:
+        by_server[record["server"]].append(record)
+
+    result = []
+    for server, events in by_server.items():
+        events.sort(key=lambda record: record["at"])
+        current = None
+        request = None
+        for record in events:
+            at, event = record["at"], record["event"]
+            if event == "request":
+                if record.get("action") == "start":
+                    request = record
+                continue
+            if event == "start":
+                if current:
+                    current.end(at)
+                requester = record.get("requester")
+                if request and at - request["at"] <= REQUEST_WINDOW_SECONDS * 1000:
+                    requester = requester or request.get("requester")
+                request = None
+                current = Session(server, at, requester, True)
+                result.append(current)
+                continue
+            if current is None:
+                if event == "stop":
+                    continue
+                # No start event, e.g. from before starts were recorded
+                current = Session(server, at, None, False)
+                result.append(current)
+            if event == "ready":
+                current.ready = current.ready or at
+            elif event in ("active", "idle"):
+                current.set_players(at, record.get("players", 0))
+            elif event == "stop":
+                current.end(at)
+                current = None
+        if current:
+            current.end(now)
+    return result
+
+
+def iso_week(at: int) -> str:
+    year, week, _ = datetime.datetime.fromtimestamp(
+        at / 1000, datetime.timezone.utc
+    ).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def aggregate(session_list: list[Session], by: list[str]) -> list[dict]:
+    groups = defaultdict(list)
+    for session in session_list:
+        keys = {
+            "server": session.server,
+            "week": iso_week(session.started),
+            "requester": session.requester or "unknown",
+        }
+        groups[tuple(keys[name] for name in by)].append(session)
+
+    rows = []
+    for key, group in sorted(groups.items()):
+        uptime_hours = sum(s.ended - s.started for s in group) / 3600000
+        cost = sum(
+            (s.ended - s.started)
+            / 3600000
+            * INSTANCE_PRICES.get(SERVER_INSTANCE_TYPES.get(s.server), 0.0)
+            for s in group
+        )
+        ready_seconds = [
+            (s.ready - s.started) / 1000 for s in group if s.ready and s.from_start
+        ]
+        row = dict(zip(by, key))
+        row.update(
+            {
+                "sessions": len(group),
+                "uptime_hours": round(uptime_hours, 2),
+                "active_hours": round(sum(s.active_ms for s in group) / 3600000, 2),
+                "player_hours": round(sum(s.player_ms for s in group) / 3600000, 2),
+                "cost_usd": round(cost, 2),
+            }
+        )
+        if ready_seconds:
+            row.update(
+                {
+                    "ready_p50_s": round(percentile(ready_seconds, 50), 1),
+                    "ready_p90_s": round(percentile(ready_seconds, 90), 1),
+                    "ready_max_s": round(max(ready_seconds), 1),
+                }
+            )
+        rows.append(row)
+    return rows
+
+
+def print_table(rows: list[dict], by: list[str]):
+    if not rows:
+        print("No sessions")
+        return
+    columns = by + [
+        "sessions",
+        "uptime_hours",
+        "active_hours",
+        "player_hours",
+        "cost_usd",
+        "ready_p50_s",
+        "ready_p90_s",
+        "ready_max_s",
+    ]
+    cells = [[str(row.get(column, "-")) for column in columns] for row in rows]
+    widths = [
+        max(len(column), *(len(line[i]) for line in cells))
+        for i, column in enumerate(columns)
+    ]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--store",
+        default=DEFAULT_TABLE,
+        help="DynamoDB table name, or a .jsonl file",
+    )
+    parser.add_argument(
+        "--by",
+        nargs="+",
+        choices=["server", "week", "requester"],
+        default=["server"],
+    )
+    parser.add_argument("--server", help="Only this server")
+    parser.add_argument("--since", help="Only events from this date, YYYY-MM-DD")
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    args = parser.parse_args()
+
+    since = 0
+    if args.since:
+        since = int(
+            datetime.datetime.fromisoformat(args.since)
+            .replace(tzinfo=datetime.timezone.utc)
+            .timestamp()
+            * 1000
+        )
+    store = sessions.open_store(args.store)
+    records = store.scan(server=args.server, since=since)
+    rows = aggregate(build_sessions(records, int(time.time() * 1000)), args.by)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows, args.by)
@@ -0,0 +1,294 @@
+"""
+UDP load generator for game server traffic.
+
+Run a reflector on the server instance, with the game stopped so its ports are
+free, and the sender on another machine on the LAN, or both on one machine over
+loopback.  The sender sends game-like packets each server tick on every game
+port and the reflector echoes them back.  The sender reports round trip loss,
+reorder, duplicates, latency and jitter per port.  Both sides report the
+kernel's UDP buffer drops from /proc/net/snmp, which tell socket buffer
+overflows apart from loss on the network.
+
+    python3 tools/udp_loadgen.py serve --game valheim
+    python3 tools/udp_loadgen.py send {server ip} --game valheim --players 10
+
+Use --rcvbuf on the reflector to try a socket buffer size without changing the
+system defaults.
+
+"""
+
+import argparse
+import json
+import random
+import selectors
+import socket
+import struct
+import time
+
+from stats import percentile
+
+
+# Game ports, server tick rate and packet sizes with their weights
+PROFILES = {
+    "moria": {
+        "ports": [7777],
+        "tick_hz": 30,
+        "sizes": [(96, 0.55), (320, 0.3), (900, 0.1), (1200, 0.05)],
+    },
+    "valheim": {
+        "ports": [2456, 2457, 2458],
+        "tick_hz": 20,
+        "sizes": [(64, 0.5), (256, 0.3), (1024, 0.15), (1400, 0.05)],
+    },
+}
+
+# Sequence number, send time and port index, followed by padding
+PACKET = struct.Struct("<Qdi")
+DRAIN_SECONDS = 1.0
+# Large sender receive buffers, capped by net.core.rmem_max, so that echoes are
+# not dropped on the sender side
+SENDER_RCVBUF = 8 * 1024**2
+SNMP_COUNTERS = ("InDatagrams", "InErrors", "RcvbufErrors", "SndbufErrors")
+
+
+def udp_counters() -> dict[str, int]:
+    """Kernel UDP counters, or nothing where /proc/net/snmp is unavailable."""
+    try:
+        with open("/proc/net/snmp") as fp:
+            lines = [line.split() for line in fp if line.startswith("Udp:")]
+    except FileNotFoundError:
+        return {}
+    counters = dict(zip(lines[0][1:], (int(value) for value in lines[1][1:])))
+    return {key: counters[key] for key in SNMP_COUNTERS if key in counters}
+
+
+def counter_delta(before: dict[str, int], after: dict[str, int]) -> dict[str, int]:
+    return {key: after[key] - before[key] for key in after if key in before}
+
+
+def serve(ports: list[int], rcvbuf: int | None):
+    """Echo every datagram back to its sender until interrupted."""
+    selector = selectors.DefaultSelector()
+    for port in ports:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.bind(("0.0.0.0", port))
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        print(
+            f"Reflecting on udp/{port}, receive buffer "
+            f"{sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)} bytes"
+        )
+
+    before = udp_counters()
+    echoed = 0
+    try:
+        while True:
+            for key, _ in selector.select():
+                sock = key.fileobj
+                # Drain everything queued before waiting again
+                while True:
+                    try:
+                        data, address = sock.recvfrom(65535)
+                    except BlockingIOError:
+                        break
+                    try:
+                        sock.sendto(data, address)
+                        echoed += 1
+                    except BlockingIOError:
+                        pass
+    except KeyboardInterrupt:
+        pass
+    print(f"Echoed {echoed} packets")
+    print(f"Kernel UDP counters: {counter_delta(before, udp_counters())}")
+
+
+class PortStats:
+    def __init__(self, port: int):
+        self.port = port
+        self.sent = 0
+        self.bytes_sent = 0
+        self.received = set()
+        self.duplicates = 0
+        self.reordered = 0
+        self.highest = -1
+        self.rtts = []
+        self.jitter = 0.0
+        self.last_rtt = None
+
+    def receive(self, seq: int, rtt: float):
+        if seq in self.received:
+            self.duplicates += 1
+            return
+        self.received.add(seq)
+        if seq < self.highest:
+            self.reordered += 1
+        self.highest = max(self.highest, seq)
+        self.rtts.append(rtt)
+        # Interarrival jitter as in RFC 3550, over round trip times
+        if self.last_rtt is not None:
+            self.jitter += (abs(rtt - self.last_rtt) - self.jitter) / 16
+        self.last_rtt = rtt
+
+    def report(self) -> dict:
+        received = len(self.received)
+        report = {
+            "port": self.port,
+            "sent": self.sent,
+            "received": received,
+            "loss_pct": 100 * (1 - received / self.sent) if self.sent else 0.0,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "jitter_ms": self.jitter * 1000,
+        }
+        if self.rtts:
+            report.update(
+                {
+                    "rtt_p50_ms": percentile(self.rtts, 50) * 1000,
+                    "rtt_p99_ms": percentile(self.rtts, 99) * 1000,
+                    "rtt_max_ms": max(self.rtts) * 1000,
+                }
+            )
+        return report
+
+
+def send(
+    host: str,
+    ports: list[int],
+    tick_hz: float,
+    packets_per_tick: int,
+    sizes: list[tuple[int, float]],
+    duration: float,
+    seed: int,
+) -> dict:
+    """Send `packets_per_tick` packets to every port each tick, as a server
+    sending one update per player, and collect the echoes."""
+    rng = random.Random(seed)
+    lengths, weights = zip(*sizes)
+    padding = bytes(max(lengths))
+
+    selector = selectors.DefaultSelector()
+    sockets = []
+    stats = []
+    for index, port in enumerate(ports):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SENDER_RCVBUF)
+        sock.connect((host, port))
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, index)
+        sockets.append(sock)
+        stats.append(PortStats(port))
+
+    def receive(timeout: float):
+        for key, _ in selector.select(max(0, timeout)):
+            port_stats = stats[key.data]
+            while True:
+                try:
+                    data = key.fileobj.recv(65535)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                seq, sent_at, _ = PACKET.unpack_from(data)
+                port_stats.receive(seq, time.perf_counter() - sent_at)
+
+    before = udp_counters()
+    started = time.perf_counter()
+    interval = 1 / tick_hz
+    next_tick = started
+    seq = 0
+    while next_tick < started + duration:
+        receive(next_tick - time.perf_counter())
+        if time.perf_counter() < next_tick:
+            continue
+        for _ in range(packets_per_tick):
+            for index, sock in enumerate(sockets):
+                length = rng.choices(lengths, weights)[0]
+                header = PACKET.pack(seq, time.perf_counter(), index)
+                try:
+                    sock.send(header + padding[: length - PACKET.size])
+                except (BlockingIOError, ConnectionRefusedError):
+                    pass
+                stats[index].sent += 1
+                stats[index].bytes_sent += length
+                seq += 1
+        next_tick += interval
+
+    drain_until = time.perf_counter() + DRAIN_SECONDS
+    while time.perf_counter() < drain_until:
+        receive(drain_until - time.perf_counter())
+    elapsed = time.perf_counter() - started - DRAIN_SECONDS
+
+    return {
+        "host": host,
+        "seconds": round(elapsed, 3),
+        "packets_per_second": round(sum(s.sent for s in stats) / elapsed),
+        "mbit_per_second": round(
+            sum(s.bytes_sent for s in stats) * 8 / elapsed / 1e6, 2
+        ),
+        "ports": [s.report() for s in stats],
+        "kernel": counter_delta(before, udp_counters()),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Echo packets back")
+    serve_parser.add_argument("--rcvbuf", type=int, help="SO_RCVBUF in bytes")
+
+    send_parser = subparsers.add_parser("send", help="Send packets and measure")
+    send_parser.add_argument("host")
+    send_parser.add_argument("--players", type=int, default=10)
+    send_parser.add_argument("--tick-hz", type=float, help="Override tick rate")
+    send_parser.add_argument("-d", "--duration", type=float, default=30)
+    send_parser.add_argument("--seed", type=int, default=0)
+    send_parser.add_argument("--json", action="store_true", help="Print JSON results")
+
+    for subparser in (serve_parser, send_parser):
+        subparser.add_argument(
+            "-g", "--game", choices=sorted(PROFILES), default="valheim"
+        )
+        subparser.add_argument(
+            "-p", "--ports", type=int, nargs="+", help="Override ports"
+        )
+    args = parser.parse_args()
+
+    profile = PROFILES[args.game]
+    ports = args.ports or profile["ports"]
+    if args.mode == "serve":
+        serve(ports, args.rcvbuf)
+    else:
+        result = send(
+            args.host,
+            ports,
+            args.tick_hz or profile["tick_hz"],
+            args.players,
+            profile["sizes"],
+            args.duration,
+            args.seed,
+        )
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{result['packets_per_second']} packets/s, "
+                f"{result['mbit_per_second']} Mbit/s for {result['seconds']:.1f}s"
+            )
+            for port in result["ports"]:
+                line = (
+                    f"  udp/{port['port']}: loss {port['loss_pct']:.2f}% "
+                    f"({port['sent'] - port['received']}/{port['sent']}), "
+                    f"reordered {port['reordered']}, "
+                    f"duplicates {port['duplicates']}, "
+                    f"jitter {port['jitter_ms']:.2f} ms"
+                )
+                if "rtt_p50_ms" in port:
+                    line += (
+                        f", rtt p50 {port['rtt_p50_ms']:.2f} ms"
+                        f" p99 {port['rtt_p99_ms']:.2f} ms"
+                        f" max {port['rtt_max_ms']:.2f} ms"
+                    )
+                print(line)
+            print(f"  kernel UDP counters: {result['kernel']}")
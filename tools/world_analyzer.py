@@ -0,0 +1,359 @@
+"""
+Analyze a Valheim world save (`worlds_local/<world>.db`) for ZDO bloat.
+
+Every object in a Valheim world (building pieces, creatures, dropped items,
+ships) is a ZDO.  World load time and server tick time grow with the number of
+ZDOs, and especially with ZDOs packed into the sectors players spend time in.
+This walks the ZDO table without decoding object data, reading the file through
+a sliding memory-mapped window so memory stays flat on large worlds.
+
+    python tools/world_analyzer.py /mnt/efs/valheim/worlds_local/Midgard.db
+    python tools/world_analyzer.py Midgard.db --json >> world-trend.jsonl
+
+Prefabs are stored as hashes; known names are resolved from the lists below and
+from any extra names passed with `--names` (one prefab name per line).  Only
+worlds saved by Valheim 0.214 or later are supported.
+
+"""
+
+import argparse
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import Counter
+
+
+# Worlds older than this store ZDOs in the pre-0.214 layout.
+MIN_WORLD_VERSION = 31
+# Valheim zones are 64m squares.
+SECTOR_SIZE = 64
+WINDOW_SIZE = 64 * 1024 * 1024
+
+# World version, net time, session id, next uid, ZDO count
+WORLD_HEADER = struct.Struct("<idqIi")
+# ZDO id (user id, id), data length, then the start of the data: flags, sector,
+# position and prefab hash
+ZDO_HEADER = struct.Struct("<qIiHhhfffi")
+ZDO_MIN_LENGTH = ZDO_HEADER.size - 16
+
+DROPPED_ITEMS = [
+    "Amber",
+    "AmberPearl",
+    "AskBladder",
+    "AskHide",
+    "BlackMetalScrap",
+    "Bloodbag",
+    "Blueberries",
+    "BoneFragments",
+    "Carapace",
+    "Chain",
+    "CharredBone",
+    "Chitin",
+    "Cloudberry",
+    "Coal",
+    "Coins",
+    "Copper",
+    "CopperOre",
+    "CoreWood",
+    "Crystal",
+    "Dandelion",
+    "DeerHide",
+    "ElderBark",
+    "Entrails",
+    "Feathers",
+    "FineWood",
+    "Flax",
+    "Flint",
+    "FreezeGland",
+    "Grausten",
+    "GreydwarfEye",
+    "Guck",
+    "Iron",
+    "IronScrap",
+    "LeatherScraps",
+    "LoxPelt",
+    "Mushroom",
+    "MushroomYellow",
+    "NeckTail",
+    "Obsidian",
+    "Ooze",
+    "Raspberry",
+    "RawMeat",
+    "Resin",
+    "Ruby",
+    "SerpentScale",
+    "SilverOre",
+    "Softtissue",
+    "Stone",
+    "SurtlingCore",
+    "Tar",
+    "Thistle",
+    "Tin",
+    "TinOre",
+    "TrollHide",
+    "WitheredBone",
+    "WolfFang",
+    "WolfPelt",
+    "Wood",
+    "YggdrasilWood",
+]
+SHIPS = [
+    "Cart",
+    "Karve",
+    "Raft",
+    "Trailership",
+    "VikingShip",
+    "VikingShip_Ashlands",
+]
+CREATURES = [
+    "Asksvin",
+    "Boar",
+    "Chicken",
+    "Deer",
+    "Greydwarf",
+    "Hen",
+    "Lox",
+    "Neck",
+    "Seagal",
+    "Skeleton",
+    "Wolf",
+]
+OTHER_PREFABS = [
+    "Player_tombstone",
+    "bonfire",
+    "charcoal_kiln",
+    "blastfurnace",
+    "fire_pit",
+    "piece_beehive",
+    "piece_groundtorch",
+    "piece_sapcollector",
+    "portal_wood",
+    "smelter",
+    "windmill",
+]
+
+
+def stable_hash(name: str) -> int:
+    """Port of Valheim's `string.GetStableHashCode()` (wrapping int32 math)."""
+    num = num2 = 5381
+    for index in range(0, len(name), 2):
+        num = (((num << 5) + num) ^ ord(name[index])) & 0xFFFFFFFF
+        if index == len(name) - 1:
+            break
+        num2 = (((num2 << 5) + num2) ^ ord(name[index + 1])) & 0xFFFFFFFF
+    value = (num + num2 * 1566083941) & 0xFFFFFFFF
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def sector_coords(key: int) -> tuple[int, int]:
+    x, y = key >> 16, key & 0xFFFF
+    return (x - 0x10000 if x & 0x8000 else x), (y - 0x10000 if y & 0x8000 else y)
+
+
+class WindowedMap:
+    """Read-only view of a file through a sliding mmap window."""
+
+    def __init__(self, fp, window: int = WINDOW_SIZE):
+        self.fileno = fp.fileno()
+        self.size = os.fstat(self.fileno).st_size
+        self.window = window
+        self.start = 0
+        self.end = 0
+        self.mm = None
+
+    def remap(self, offset: int):
+        """Map a window that starts at or just before `offset`."""
+        if self.mm is not None:
+            self.mm.close()
+        self.start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        length = min(self.window, self.size - self.start)
+        self.mm = mmap.mmap(
+            self.fileno, length, access=mmap.ACCESS_READ, offset=self.start
+        )
+        if hasattr(self.mm, "madvise"):
+            self.mm.madvise(mmap.MADV_SEQUENTIAL)
+        self.end = self.start + length
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+
+
+def scan_world(path: str, names: list[str], window: int = WINDOW_SIZE) -> dict:
+    """Count ZDOs by prefab and sector in a single pass over the ZDO table,
+    mapping `window` bytes of the file at a time."""
+    started = time.perf_counter()
+    item_hashes = {stable_hash(name) for name in DROPPED_ITEMS}
+    ship_hashes = {stable_hash(name) for name in SHIPS}
+
+    prefabs = Counter()
+    sectors = Counter()
+    item_sectors = Counter()
+    ship_sectors = Counter()
+
+    with open(path, "rb") as fp:
+        view = WindowedMap(fp, window)
+        try:
+            view.remap(0)
+            version, net_time, _, _, zdo_count = WORLD_HEADER.unpack_from(view.mm, 0)
+            if version < MIN_WORLD_VERSION:
+                raise ValueError(
+                    f"World version {version} uses the old ZDO format, load and "
+                    "save it on a current server first"
+                )
+
+            unpack = ZDO_HEADER.unpack_from
+            header_size = ZDO_HEADER.size
+            offset = WORLD_HEADER.size
+            for _ in range(zdo_count):
+                if offset + header_size > view.end:
+                    if offset + header_size > view.size:
+                        raise ValueError(f"Truncated ZDO table at offset {offset}")
+                    view.remap(offset)
+                _, _, length, _, sx, sy, _, _, _, prefab = unpack(
+                    view.mm, offset - view.start
+                )
+                if length < ZDO_MIN_LENGTH:
+                    raise ValueError(f"Corrupt ZDO at offset {offset}")
+                offset += 16 + length
+
+                key = ((sx & 0xFFFF) << 16) | (sy & 0xFFFF)
+                prefabs[prefab] += 1
+                sectors[key] += 1
+                if prefab in item_hashes:
+                    item_sectors[key] += 1
+                elif prefab in ship_hashes:
+                    ship_sectors[key] += 1
+        finally:
+            view.close()
+
+    return {
+        "version": version,
+        "net_time": net_time,
+        "zdo_count": zdo_count,
+        "size_bytes": view.size,
+        "elapsed_s": time.perf_counter() - started,
+        "prefabs": prefabs,
+        "sectors": sectors,
+        "item_sectors": item_sectors,
+        "ship_sectors": ship_sectors,
+        "names": {stable_hash(name): name for name in names},
+    }
+
+
+def summarize(path: str, scan: dict, top: int) -> dict:
+    names = scan["names"]
+    prefabs = scan["prefabs"]
+
+    def prefab_name(prefab: int) -> str:
+        return names.get(prefab, f"{prefab & 0xFFFFFFFF:#010x}")
+
+    def category_total(category: list[str]) -> dict:
+        counts = {name: prefabs[stable_hash(name)] for name in category}
+        return {name: count for name, count in sorted(counts.items()) if count}
+
+    def sector_list(counter: Counter) -> list[dict]:
+        result = []
+        for key, count in counter.most_common(top):
+            x, y = sector_coords(key)
+            result.append(
+                {
+                    "sector": [x, y],
+                    "position": [x * SECTOR_SIZE, y * SECTOR_SIZE],
+                    "zdos": scan["sectors"][key],
+                    "dropped_items": scan["item_sectors"][key],
+                    "ships": scan["ship_sectors"][key],
+                }
+            )
+        return result
+
+    return {
+        "file": os.path.abspath(path),
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "size_bytes": scan["size_bytes"],
+        "world_version": scan["version"],
+        "net_time": scan["net_time"],
+        "zdo_count": scan["zdo_count"],
+        "sector_count": len(scan["sectors"]),
+        "elapsed_s": round(scan["elapsed_s"], 3),
+        "dropped_items": sum(scan["item_sectors"].values()),
+        "ships": sum(scan["ship_sectors"].values()),
+        "categories": {
+            "dropped_items": category_total(DROPPED_ITEMS),
+            "ships": category_total(SHIPS),
+            "creatures": category_total(CREATURES),
+            "other": category_total(OTHER_PREFABS),
+        },
+        "top_prefabs": [
+            {"prefab": prefab_name(prefab), "count": count}
+            for prefab, count in prefabs.most_common(top)
+        ],
+        "hotspots": sector_list(scan["sectors"]),
+        "dropped_item_hotspots": sector_list(scan["item_sectors"]),
+    }
+
+
+def print_summary(summary: dict):
+    print(
+        f"{summary['file']}: {summary['size_bytes'] / 1024**2:.1f} MB, "
+        f"world version {summary['world_version']}, {summary['zdo_count']} ZDOs in "
+        f"{summary['sector_count']} sectors (scanned in {summary['elapsed_s']}s)"
+    )
+    print(
+        f"Dropped items: {summary['dropped_items']}, ships and carts: {summary['ships']}"
+    )
+    for category, counts in summary["categories"].items():
+        if counts:
+            listing = ", ".join(f"{name} {count}" for name, count in counts.items())
+            print(f"  {category}: {listing}")
+
+    print("\nTop prefabs")
+    for entry in summary["top_prefabs"]:
+        print(f"  {entry['count']:>9}  {entry['prefab']}")
+
+    for title, key in (
+        ("ZDO hotspots", "hotspots"),
+        ("Dropped item hotspots", "dropped_item_hotspots"),
+    ):
+        print(f"\n{title} (sector: zdos / items / ships @ x,z)")
+        for entry in summary[key]:
+            x, y = entry["sector"]
+            px, py = entry["position"]
+            print(
+                f"  {x:>5},{y:<5} {entry['zdos']:>8} / {entry['dropped_items']:>6}"
+                f" / {entry['ships']:>3} @ {px},{py}"
+            )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("world", help="Path to the world .db file")
+    parser.add_argument(
+        "--names", help="File of extra prefab names to resolve, one per line"
+    )
+    parser.add_argument("--top", type=int, default=15, help="Entries per listing")
+    parser.add_argument(
+        "--json", action="store_true", help="Print a single-line JSON summary"
+    )
+    args = parser.parse_args()
+
+    names = DROPPED_ITEMS + SHIPS + CREATURES + OTHER_PREFABS
+    if args.names:
+        with open(args.names) as fp:
+            names += [line.strip() for line in fp if line.strip()]
+
+    try:
+        scan = scan_world(args.world, names)
+    except (ValueError, struct.error) as ex:
+        sys.exit(f"Could not read {args.world}: {ex}")
+
+    summary = summarize(args.world, scan, args.top)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print_summary(summary)